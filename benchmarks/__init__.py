@@ -0,0 +1,11 @@
+import os
+import tempfile
+
+
+def use_scratch_database():
+	# point the app at a throwaway database unless one was given explicitly;
+	# must run before `notes` is imported
+	if not os.environ.get('DATABASE_URL'):
+		path = os.path.join(tempfile.mkdtemp(prefix='notes-bench-'), 'bench.db')
+		os.environ['DATABASE_URL'] = 'sqlite:///' + path
+	return os.environ['DATABASE_URL']
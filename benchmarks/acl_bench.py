@@ -0,0 +1,117 @@
+"""Measure note sharing for a user holding tens of thousands of grants.
+
+    python -m benchmarks.acl_bench --users 50 --notes-per-user 1000 \
+        --requests 200
+
+Seeds private notes only (benchmarks.seed knobs), shares every note not
+owned by the first user with that user through PrivateAccess, logs in as
+them and reports latency and SQL statements per request for:
+
+* note_view of a shared note and of a private note that is not shared;
+* the "shared with me" listing, first page and a page deep in the grants;
+* an owner's user_notes page, which mixes shared and unshared notes.
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks import use_scratch_database
+from benchmarks import seed as seeding
+from benchmarks.load import QueryCounter, percentile, login
+
+
+def measure(client, paths, counter):
+	latencies, queries, statuses = [], [], set()
+	for path in paths:
+		counter.reset()
+		started = time.perf_counter()
+		response = client.get(path)
+		response.get_data()
+		latencies.append(time.perf_counter() - started)
+		queries.append(counter.count)
+		statuses.add(response.status_code)
+	latencies.sort()
+	return {
+		'requests': len(latencies),
+		'statuses': sorted(statuses),
+		'p50_ms': 1000 * percentile(latencies, 0.50),
+		'p99_ms': 1000 * percentile(latencies, 0.99),
+		'sql_max': max(queries),
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__,
+				formatter_class=argparse.RawDescriptionHelpFormatter)
+	seeding.add_arguments(parser)
+	parser.add_argument('--requests', type=int, default=200)
+	parser.set_defaults(users=50, notes_per_user=1000, anonymous_notes=0,
+						private_ratio=1.0, grants_per_note=0.0, text_size=200)
+	args = parser.parse_args()
+
+	url = use_scratch_database()
+	from sqlalchemy import event
+	from sqlalchemy.engine import Engine
+	from notes import app, db
+	from notes.models import Note, UserNoteParams, PrivateAccess
+
+	app.config['WTF_CSRF_ENABLED'] = False
+	counter = QueryCounter()
+	rng = random.Random(args.seed)
+
+	with app.app_context():
+		summary = seeding.seed_from_args(args)
+		grantee = summary['first_user_id']
+		started = time.perf_counter()
+		db.session.execute(PrivateAccess.__table__.insert().from_select(
+			['note_id', 'user_id'],
+			db.session.query(UserNoteParams.note_id, db.literal(grantee))
+				.filter(UserNoteParams.user_id != grantee)
+				.order_by(UserNoteParams.note_id).statement))
+		db.session.commit()
+		grants = db.session.query(PrivateAccess.id, Note.url_id)\
+					.join(Note, Note.id == PrivateAccess.note_id)\
+					.filter(PrivateAccess.user_id == grantee).all()
+		summary['grants'] = len(grants)
+		summary['grant_seconds'] = time.perf_counter() - started
+		unshared = [url_id for url_id, in db.session.query(Note.url_id)
+					.join(UserNoteParams, UserNoteParams.note_id == Note.id)
+					.filter(UserNoteParams.user_id == grantee).all()]
+		owner = 'user{}'.format(grantee + 1)
+
+	event.listen(Engine, 'before_cursor_execute', counter)
+	client = app.test_client()
+	login(client, 'user{}'.format(grantee))
+	deep = grants[len(grants) // 10][0]
+	requests = args.requests
+	report = {
+		'database': url,
+		'population': summary,
+		'routes': {
+			'note_view shared': measure(client, ['/view/' + rng.choice(grants)[1]
+								for _ in range(requests)], counter),
+			'note_view own': measure(client, ['/view/' + rng.choice(unshared)
+								for _ in range(requests)], counter),
+			'shared first page': measure(client, ['/shared'] * requests,
+								counter),
+			'shared deep page': measure(client,
+								['/shared?after={}'.format(deep)] * requests,
+								counter),
+			'user_notes of a sharer': measure(client,
+								['/user/' + owner] * requests, counter),
+		},
+	}
+
+	# a private note nobody shared: the grantee's own notes are not granted
+	# to anyone, so log in as another user to be refused one of them
+	client.get('/logout')
+	login(client, owner)
+	report['routes']['note_view not shared'] = measure(client,
+				['/view/' + rng.choice(unshared) for _ in range(requests)],
+				counter)
+	print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == '__main__':
+	main()
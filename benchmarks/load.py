@@ -0,0 +1,279 @@
+"""Drive every route of the app and report latency and SQL per route.
+
+    python -m benchmarks.load --users 100 --notes-per-user 20 \
+        --requests 200 --concurrency 8 > run.json
+
+Seeds a fresh database (see benchmarks.seed for the population knobs,
+or --no-seed to reuse DATABASE_URL as is), then replays each scenario
+through the Flask test client from `--concurrency` threads. The JSON
+report has p50/p95/p99 latency, throughput and SQL statements per route
+so runs can be diffed between commits.
+"""
+import argparse
+import json
+import random
+import subprocess
+import threading
+import time
+from datetime import datetime, timedelta
+from urllib.parse import quote
+
+from benchmarks import use_scratch_database
+from benchmarks import seed as seeding
+
+
+class QueryCounter:
+	"""Counts SQL statements executed by the current thread."""
+	def __init__(self):
+		self._local = threading.local()
+
+	def __call__(self, *args):
+		self._local.count = getattr(self._local, 'count', 0) + 1
+
+	def reset(self):
+		self._local.count = 0
+
+	@property
+	def count(self):
+		return getattr(self._local, 'count', 0)
+
+
+def percentile(samples, fraction):
+	if not samples:
+		return None
+	index = min(len(samples) - 1, int(round(fraction * (len(samples) - 1))))
+	return samples[index]
+
+
+class Population:
+	def __init__(self, summary):
+		self.first_user = summary['first_user_id']
+		self.users = summary['users']
+		self.first_note = summary['first_note_id']
+		self.notes = summary['notes']
+
+	def username(self, rng):
+		return 'user{}'.format(self.first_user + rng.randrange(self.users))
+
+	def url_id(self, rng):
+		return seeding.url_id_for(self.first_note + rng.randrange(self.notes))
+
+
+def login(client, username):
+	client.post('/login', data={'username': username,
+						'password': seeding.BENCH_PASSWORD})
+
+
+def build_scenarios(population, user_id_for):
+	"""name -> callable(client, rng, counter) returning the measured response.
+
+	Setup requests (logging in, creating a note to delete) are issued before
+	the counter is reset, so only the named route is measured.
+	"""
+	def get(path, as_user=False):
+		def run(client, rng, counter):
+			if as_user:
+				login(client, population.username(rng))
+			counter.reset()
+			return client.get(path(rng) if callable(path) else path)
+		return run
+
+	def note_edit_post(client, rng, counter):
+		login(client, population.username(rng))
+		url = client.get('/create').headers['Location']
+		counter.reset()
+		return client.post(url, data={'title': 'bench',
+						'text': seeding.random_words(rng, 500), 'save': 'Save'})
+
+	def note_delete(client, rng, counter):
+		login(client, population.username(rng))
+		# drafts are stored by their first save
+		draft = client.get('/create').headers['Location']
+		url = client.post(draft, data={'title': 'bench', 'text': '',
+							'save': 'Save'}).headers['Location']
+		counter.reset()
+		return client.get(url + '/delete')
+
+	def login_post(client, rng, counter):
+		client.get('/logout')
+		counter.reset()
+		return client.post('/login', data={'username': population.username(rng),
+							'password': seeding.BENCH_PASSWORD})
+
+	def register(client, rng, counter):
+		client.get('/logout')
+		counter.reset()
+		return client.post('/register', data={
+			'username': 'bench{}'.format(rng.getrandbits(48)),
+			'password': seeding.BENCH_PASSWORD,
+			'confirm': seeding.BENCH_PASSWORD})
+
+	def profile_delete(client, rng, counter):
+		username = 'gone{}'.format(rng.getrandbits(48))
+		client.get('/logout')
+		client.post('/register', data={'username': username,
+						'password': seeding.BENCH_PASSWORD,
+						'confirm': seeding.BENCH_PASSWORD})
+		login(client, username)
+		counter.reset()
+		return client.get('/profile/delete/{}'.format(user_id_for(username)))
+
+	def activity(granularity, days):
+		# a `days` long range ending at a random day of the seeded year
+		def path(rng):
+			end = datetime.utcnow() - timedelta(days=rng.randrange(365))
+			return '/api/v1/stats/activity?granularity={}&start={}&end={}'\
+				.format(granularity,
+					(end - timedelta(days=days)).date().isoformat(),
+					end.date().isoformat())
+		return get(path)
+
+	words = seeding.WORDS
+	return {
+		'index': get('/'),
+		'index_user': get('/', as_user=True),
+		'search': get(lambda rng: '/search?search_query={}'.format(
+						rng.choice(words))),
+		'chart': get('/chart'),
+		'chart_stats': get('/api/v1/stats/notes'),
+		'activity_hour': activity('hour', 7),
+		'activity_day': activity('day', 90),
+		'activity_week': activity('week', 365),
+		'note_view': get(lambda rng: '/view/' + population.url_id(rng)),
+		'note_view_user': get(lambda rng: '/view/' + population.url_id(rng),
+						as_user=True),
+		'note_edit': get(lambda rng: '/edit/' + population.url_id(rng),
+						as_user=True),
+		'note_edit_post': note_edit_post,
+		'note_create': get('/create', as_user=True),
+		'note_delete': note_delete,
+		'user_notes': get(lambda rng: '/user/' + quote(population.username(rng))),
+		'profile': get('/profile', as_user=True),
+		'profile_delete': profile_delete,
+		'login': login_post,
+		'register': register,
+	}
+
+
+def run_scenario(app, run, requests, concurrency, counter, seed_value):
+	latencies, queries, errors = [], [], []
+	lock = threading.Lock()
+	remaining = [requests]
+
+	def worker(number):
+		rng = random.Random(seed_value * 1000 + number)
+		client = app.test_client()
+		while True:
+			with lock:
+				if remaining[0] <= 0:
+					return
+				remaining[0] -= 1
+			try:
+				started = time.perf_counter()
+				response = run(client, rng, counter)
+				# streamed pages run their queries while the body is read
+				response.get_data()
+				elapsed = time.perf_counter() - started
+				failed = response.status_code >= 500
+			except Exception as error:
+				elapsed, failed = None, repr(error)
+			with lock:
+				if failed:
+					errors.append(failed)
+				if elapsed is not None:
+					latencies.append(elapsed)
+					queries.append(counter.count)
+
+	started = time.perf_counter()
+	threads = [threading.Thread(target=worker, args=(number,))
+			for number in range(concurrency)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	wall = time.perf_counter() - started
+
+	latencies.sort()
+	return {
+		'requests': len(latencies),
+		'errors': len(errors),
+		'first_error': str(errors[0]) if errors else None,
+		'throughput_rps': len(latencies) / wall if wall else None,
+		'mean_ms': 1000 * sum(latencies) / len(latencies) if latencies else None,
+		'p50_ms': 1000 * percentile(latencies, 0.50) if latencies else None,
+		'p95_ms': 1000 * percentile(latencies, 0.95) if latencies else None,
+		'p99_ms': 1000 * percentile(latencies, 0.99) if latencies else None,
+		'sql_mean': sum(queries) / len(queries) if queries else None,
+		'sql_max': max(queries) if queries else None,
+	}
+
+
+def git_revision():
+	try:
+		return subprocess.check_output(['git', 'rev-parse', 'HEAD'],
+					stderr=subprocess.DEVNULL).decode().strip()
+	except (OSError, subprocess.CalledProcessError):
+		return None
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__,
+				formatter_class=argparse.RawDescriptionHelpFormatter)
+	seeding.add_arguments(parser)
+	parser.add_argument('--no-seed', action='store_true',
+						help='reuse the population already in DATABASE_URL')
+	parser.add_argument('--requests', type=int, default=200,
+						help='requests per route')
+	parser.add_argument('--concurrency', type=int, default=4)
+	parser.add_argument('--routes', default='',
+						help='comma separated subset of scenarios')
+	args = parser.parse_args()
+
+	url = use_scratch_database()
+	from sqlalchemy import event
+	from sqlalchemy.engine import Engine
+	from notes import app, db
+	from notes.models import User, Note
+
+	app.config['WTF_CSRF_ENABLED'] = False
+	app.config['NOTE_CREATE_BURST'] = 0
+	counter = QueryCounter()
+	event.listen(Engine, 'before_cursor_execute', counter)
+
+	with app.app_context():
+		if args.no_seed:
+			summary = {
+				'first_user_id': db.session.query(db.func.min(User.id)).scalar(),
+				'users': User.query.count(),
+				'first_note_id': db.session.query(db.func.min(Note.id)).scalar(),
+				'notes': Note.query.count(),
+			}
+		else:
+			summary = seeding.seed_from_args(args)
+	population = Population(summary)
+
+	def user_id_for(username):
+		with app.app_context():
+			return db.session.query(User.id)\
+					.filter_by(username=username).scalar()
+
+	scenarios = build_scenarios(population, user_id_for)
+	if args.routes:
+		scenarios = {name: scenarios[name] for name in args.routes.split(',')}
+
+	report = {
+		'revision': git_revision(),
+		'database': url,
+		'population': summary,
+		'requests': args.requests,
+		'concurrency': args.concurrency,
+		'routes': {},
+	}
+	for name, run in scenarios.items():
+		report['routes'][name] = run_scenario(app, run, args.requests,
+					args.concurrency, counter, args.seed)
+	print(json.dumps(report, indent=2, default=str))
+
+
+if __name__ == '__main__':
+	main()
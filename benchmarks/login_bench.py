@@ -0,0 +1,118 @@
+"""Measure login throughput while password hashing runs in the pool.
+
+    python -m benchmarks.login_bench --users 50 --requests 400 \
+        --concurrency 16 --workers 0,1,2,4 --queue 16
+
+Seeds users only, then posts /login from `--concurrency` threads once per
+PASSWORD_HASH_WORKERS value (0 hashes inline in the request thread). The
+JSON report has throughput, latency percentiles and how many logins were
+turned away with 429 while the pool and its queue were full.
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+from benchmarks import use_scratch_database
+from benchmarks import seed as seeding
+from benchmarks.load import percentile
+
+
+def run_logins(app, population, requests, concurrency, seed_value):
+	latencies, statuses = [], {}
+	succeeded = [0]
+	lock = threading.Lock()
+	remaining = [requests]
+
+	def worker(number):
+		rng = random.Random(seed_value * 1000 + number)
+		client = app.test_client()
+		while True:
+			with lock:
+				if remaining[0] <= 0:
+					return
+				remaining[0] -= 1
+			client.get('/logout')
+			started = time.perf_counter()
+			response = client.post('/login', data={
+				'username': population.username(rng),
+				'password': seeding.BENCH_PASSWORD})
+			elapsed = time.perf_counter() - started
+			# a successful login redirects to the profile page
+			logged_in = response.status_code == 302 and urlsplit(
+						response.headers.get('Location', '')).path == '/profile'
+			with lock:
+				latencies.append(elapsed)
+				statuses[response.status_code] = \
+					statuses.get(response.status_code, 0) + 1
+				succeeded[0] += logged_in
+
+	started = time.perf_counter()
+	threads = [threading.Thread(target=worker, args=(number,))
+			for number in range(concurrency)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	wall = time.perf_counter() - started
+
+	latencies.sort()
+	return {
+		'requests': len(latencies),
+		'statuses': statuses,
+		'succeeded': succeeded[0],
+		'rejected': statuses.get(429, 0),
+		'logins_per_second': succeeded[0] / wall if wall else None,
+		'p50_ms': 1000 * percentile(latencies, 0.50) if latencies else None,
+		'p95_ms': 1000 * percentile(latencies, 0.95) if latencies else None,
+		'p99_ms': 1000 * percentile(latencies, 0.99) if latencies else None,
+	}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__,
+				formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--users', type=int, default=50)
+	parser.add_argument('--requests', type=int, default=400)
+	parser.add_argument('--concurrency', type=int, default=16)
+	parser.add_argument('--workers', default='0,1,2,4',
+						help='comma separated PASSWORD_HASH_WORKERS values')
+	parser.add_argument('--queue', type=int, default=16,
+						help='PASSWORD_HASH_QUEUE')
+	parser.add_argument('--seed', type=int, default=1)
+	args = parser.parse_args()
+
+	url = use_scratch_database()
+	from notes import app
+	from notes.hashing import password_hasher
+	from benchmarks.load import Population
+
+	app.config['WTF_CSRF_ENABLED'] = False
+	with app.app_context():
+		summary = seeding.seed(users=args.users, notes_per_user=0,
+						anonymous_notes=0, seed_value=args.seed)
+	population = Population(summary)
+
+	report = {
+		'database': url,
+		'users': args.users,
+		'requests': args.requests,
+		'concurrency': args.concurrency,
+		'queue': args.queue,
+		'method': app.config['PASSWORD_HASH_METHOD'],
+		'workers': {},
+	}
+	for workers in [int(value) for value in args.workers.split(',')]:
+		app.config['PASSWORD_HASH_WORKERS'] = workers
+		app.config['PASSWORD_HASH_QUEUE'] = args.queue
+		password_hasher.init_app(app)
+		report['workers'][workers] = run_logins(app, population,
+					args.requests, args.concurrency, args.seed)
+	password_hasher.shutdown()
+	print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,102 @@
+"""Check read/write routing against a primary and a lagging replica.
+
+    python -m benchmarks.replicas
+
+Uses two SQLite files in a scratch directory: the primary, and a replica
+that is a copy of it taken after seeding, so it lags behind every later
+write. Prints how many statements each engine ran per step and fails if
+a read-only page missed the replica, a page after a write or a page
+built for the shared response cache missed the primary, or an anonymous
+visitor got the note as it was before an edit. With MySQL, point DATABASE_URL and DATABASE_REPLICA_URLS at two
+schemas and copy the primary into the replica after seeding yourself.
+"""
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks import seed as seeding
+
+
+def main():
+	directory = tempfile.mkdtemp(prefix='notes-replicas-')
+	primary = os.path.join(directory, 'primary.db')
+	replica = os.path.join(directory, 'replica.db')
+	os.environ['DATABASE_URL'] = 'sqlite:///' + primary
+	os.environ['DATABASE_REPLICA_URLS'] = 'sqlite:///' + replica
+
+	from sqlalchemy import event
+	from notes import app, db
+
+	app.config['WTF_CSRF_ENABLED'] = False
+	app.config['REPLICA_STICKY_SECONDS'] = 1
+	with app.app_context():
+		summary = seeding.seed(users=5, notes_per_user=5, anonymous_notes=5)
+		db.session.remove()
+		shutil.copyfile(primary, replica)
+		engines = {'primary': db.engine,
+				'replica': db.get_engine(bind='replica_0')}
+
+	counts = {name: 0 for name in engines}
+
+	def counter(name):
+		def count(*args):
+			counts[name] += 1
+		return count
+	for name, engine in engines.items():
+		event.listen(engine, 'before_cursor_execute', counter(name))
+
+	report, failures = [], []
+	client = app.test_client()
+
+	def step(name, expect, request):
+		for engine in counts:
+			counts[engine] = 0
+		response = request()
+		# streamed pages run their queries while the body is read
+		response.get_data()
+		report.append({'step': name, 'status': response.status_code,
+					'statements': dict(counts)})
+		if expect and not counts[expect]:
+			failures.append('{}: nothing ran on the {}'.format(name, expect))
+		other = 'replica' if expect == 'primary' else 'primary'
+		if expect == 'primary' and counts[other]:
+			failures.append('{}: read from the replica'.format(name))
+		return response
+
+	username = 'user{}'.format(summary['first_user_id'])
+	anonymous = app.test_client()
+	step('index cache fill', 'primary', lambda: anonymous.get('/'))
+	step('search', 'replica', lambda: anonymous.get(
+			'/search?search_query=note'))
+	step('login', 'primary', lambda: client.post('/login', data={
+			'username': username, 'password': seeding.BENCH_PASSWORD}))
+	time.sleep(app.config['REPLICA_STICKY_SECONDS'])
+	step('user_notes', 'replica', lambda: client.get('/user/' + username))
+	url_id = seeding.url_id_for(summary['first_note_id'])
+	step('note_edit', 'primary', lambda: client.post('/edit/' + url_id,
+			data={'title': 'edited on the primary', 'text': 'new body',
+				'publish': 'Publish'}))
+	view = step('note_view after edit', 'primary',
+			lambda: client.get('/view/' + url_id))
+	if b'edited on the primary' not in view.data:
+		failures.append('note_view after edit showed the old title')
+	time.sleep(app.config['REPLICA_STICKY_SECONDS'])
+	view = step('note_view later', 'replica',
+			lambda: client.get('/view/' + url_id))
+	report.append({'replica_lagging': b'edited on the primary' not in view.data})
+	view = step('anonymous note_view after edit', 'primary',
+			lambda: anonymous.get('/view/' + url_id))
+	if b'edited on the primary' not in view.data:
+		failures.append('the response cache stored the replica\'s old note')
+
+	print(json.dumps({'directory': directory, 'steps': report,
+					'failures': failures}, indent=2))
+	if failures:
+		sys.exit(1)
+
+
+if __name__ == '__main__':
+	main()
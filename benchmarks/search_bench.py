@@ -0,0 +1,99 @@
+"""Compare the inverted-index search with the old LIKE '%q%' scan.
+
+    python -m benchmarks.search_bench --notes 20000 --repeat 20
+
+Seeds a scratch database (or DATABASE_URL) with a generated corpus and
+prints per-query timings for both paths as JSON.
+"""
+import argparse
+import json
+import random
+import time
+
+from benchmarks import use_scratch_database
+
+
+WORDS = ('alpha beta gamma delta kernel python flask query index table '
+		'note draft plan idea meeting budget travel recipe garden music '
+		'cache latency socket thread buffer vector matrix sketch review').split()
+
+
+def random_text(rng, words):
+	return ' '.join(rng.choice(WORDS) + str(rng.randrange(500))
+					for _ in range(words))
+
+
+def seed(db, Note, notes, words, rng):
+	from notes.search import reindex_all
+	db.drop_all()
+	db.create_all()
+	rows = [{'url_id': 'b{:08d}'.format(i),
+			'title': random_text(rng, 4),
+			'text': random_text(rng, words)} for i in range(notes)]
+	for start in range(0, len(rows), 1000):
+		db.session.execute(Note.__table__.insert(), rows[start:start + 1000])
+	db.session.commit()
+	started = time.perf_counter()
+	reindex_all()
+	return time.perf_counter() - started
+
+
+def like_search(db, Note, User, UserNoteParams, query):
+	from sqlalchemy import or_
+	pattern = '%{}%'.format(query)
+	return db.session.query(Note.id, Note.title, Note.url_id,
+					Note.text, Note.updated, User.username)\
+				.join(UserNoteParams,
+					UserNoteParams.note_id == Note.id, isouter=True)\
+				.join(User, User.id == UserNoteParams.user_id, isouter=True)\
+				.filter(or_(User.username.like(pattern),
+							Note.title.like(pattern),
+							Note.text.like(pattern)))\
+				.order_by(Note.updated.desc()).all()
+
+
+def timed(fn, repeat):
+	samples = []
+	for _ in range(repeat):
+		started = time.perf_counter()
+		result = fn()
+		samples.append(time.perf_counter() - started)
+	samples.sort()
+	return {'median_ms': samples[len(samples) // 2] * 1000,
+			'max_ms': samples[-1] * 1000}, result
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__)
+	parser.add_argument('--notes', type=int, default=20000)
+	parser.add_argument('--words', type=int, default=200,
+						help='words per note body')
+	parser.add_argument('--repeat', type=int, default=10)
+	parser.add_argument('--seed', type=int, default=1)
+	args = parser.parse_args()
+
+	url = use_scratch_database()
+	from notes import app, db
+	from notes.models import Note, User, UserNoteParams
+	from notes.search import search_notes, note_snippets
+
+	rng = random.Random(args.seed)
+	report = {'database': url, 'notes': args.notes, 'words': args.words,
+			'queries': []}
+	with app.app_context():
+		report['index_build_s'] = seed(db, Note, args.notes, args.words, rng)
+		for query in ('kernel42', 'music7 budget13', 'zzz'):
+			like, like_rows = timed(lambda: like_search(
+						db, Note, User, UserNoteParams, query), args.repeat)
+			fts, (fts_rows, _) = timed(lambda: search_notes(query), args.repeat)
+			snip, _ = timed(lambda: note_snippets(
+						[row.id for row in fts_rows], query), args.repeat)
+			report['queries'].append({'query': query,
+				'like': dict(like, rows=len(like_rows)),
+				'fulltext': dict(fts, first_page_rows=len(fts_rows)),
+				'snippets': snip})
+	print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,189 @@
+"""Seed a database with a synthetic population of users and notes.
+
+    python -m benchmarks.seed --users 200 --notes-per-user 50 \
+        --anonymous-notes 2000 --private-ratio 0.3 --text-size 2000
+
+Writes to DATABASE_URL, or to a scratch SQLite file when it is unset, and
+prints a JSON summary. Every user's password is BENCH_PASSWORD.
+"""
+import argparse
+import json
+import math
+import random
+import time
+from datetime import datetime, timedelta
+
+from benchmarks import use_scratch_database
+
+
+BENCH_PASSWORD = 'benchmark-password'
+WORDS = ('alpha beta gamma delta kernel python flask query index table '
+		'note draft plan idea meeting budget travel recipe garden music '
+		'cache latency socket thread buffer vector matrix sketch review '
+		'monday friday summer winter project release bug feature design').split()
+
+
+class TextSizes:
+	"""Body lengths in characters: fixed, uniform or lognormal around `mean`."""
+	def __init__(self, mean, distribution='lognormal', sigma=1.0):
+		self.mean = mean
+		self.distribution = distribution
+		self.sigma = sigma
+
+	def sample(self, rng):
+		if self.distribution == 'fixed':
+			return self.mean
+		if self.distribution == 'uniform':
+			return rng.randint(0, 2 * self.mean)
+		# lognormal with the requested mean: mu = ln(mean) - sigma^2 / 2
+		mu = max(0.0, math.log(max(self.mean, 1)) - self.sigma ** 2 / 2)
+		return int(rng.lognormvariate(mu, self.sigma))
+
+
+def random_words(rng, length):
+	words = []
+	size = 0
+	while size < length:
+		word = rng.choice(WORDS) + str(rng.randrange(1000))
+		words.append(word)
+		size += len(word) + 1
+	return ' '.join(words)[:length]
+
+
+def url_id_for(number):
+	return 'b{:08d}'.format(number)
+
+
+def insert_chunked(table, rows, chunk=1000):
+	from notes import db
+	for start in range(0, len(rows), chunk):
+		db.session.execute(table.insert(), rows[start:start + chunk])
+
+
+def seed(users=100, notes_per_user=20, anonymous_notes=500,
+		text_sizes=None, private_ratio=0.3, change_ratio=0.2,
+		grants_per_note=0.1, days=365, seed_value=1, drop=True):
+	"""Populate the configured database; returns a summary dict."""
+	from notes import db
+	from notes.models import User, Note, UserNoteParams, PrivateAccess
+	from notes.search import reindex_all
+	from notes.stats import rebuild_stats
+	from notes.activity import backfill_activity
+	from notes.compression import pack_text
+	from werkzeug.security import generate_password_hash
+
+	rng = random.Random(seed_value)
+	text_sizes = text_sizes or TextSizes(1000)
+	started = time.perf_counter()
+	if drop:
+		db.drop_all()
+	db.create_all()
+
+	password_hash = generate_password_hash(BENCH_PASSWORD)
+	first_user = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+	insert_chunked(User.__table__, [{
+		'id': first_user + number,
+		'username': 'user{}'.format(first_user + number),
+		'email': 'user{}@example.com'.format(first_user + number),
+		'password_hash': password_hash,
+	} for number in range(users)])
+
+	now = datetime.utcnow()
+	first_note = (db.session.query(db.func.max(Note.id)).scalar() or 0) + 1
+	summary = {'users': users, 'notes': 0, 'user_notes': 0,
+			'private_notes': 0, 'grants': 0, 'text_bytes': 0}
+	notes, params, grants = [], [], []
+
+	def flush():
+		# notes first: params and grants reference them
+		insert_chunked(Note.__table__, notes)
+		insert_chunked(UserNoteParams.__table__, params)
+		insert_chunked(PrivateAccess.__table__, grants)
+		db.session.commit()
+		del notes[:], params[:], grants[:]
+
+	owned_notes = users * notes_per_user
+	for number in range(owned_notes + anonymous_notes):
+		note_id = first_note + number
+		created = now - timedelta(seconds=rng.uniform(0, days * 86400))
+		text = random_words(rng, text_sizes.sample(rng))
+		packed, packed_z = pack_text(text)
+		notes.append({
+			'id': note_id,
+			'url_id': url_id_for(note_id),
+			'title': random_words(rng, rng.randint(8, 60)),
+			'text': packed,
+			'text_z': packed_z,
+			'created': created,
+			'updated': created + timedelta(seconds=rng.uniform(0, 86400)),
+		})
+		summary['notes'] += 1
+		summary['text_bytes'] += len(text)
+		if number < owned_notes:
+			owner = first_user + number // notes_per_user
+			private = rng.random() < private_ratio
+			params.append({
+				'note_id': note_id,
+				'user_id': owner,
+				'private_access': private,
+				'change_possibility': rng.random() < change_ratio,
+				'encryption': False,
+			})
+			summary['user_notes'] += 1
+			summary['private_notes'] += private
+			if private and users > 1 and rng.random() < grants_per_note:
+				grantee = first_user + (owner - first_user
+						+ rng.randrange(1, users)) % users
+				grants.append({'note_id': note_id, 'user_id': grantee})
+				summary['grants'] += 1
+		if len(notes) >= 1000:
+			flush()
+	flush()
+
+	reindex_all()
+	rebuild_stats()
+	# the /chart rollups of every seeded week, the current one included
+	backfill_activity(now - timedelta(days=days), now + timedelta(weeks=1))
+	summary.update(first_user_id=first_user, first_note_id=first_note,
+				seconds=time.perf_counter() - started)
+	return summary
+
+
+def add_arguments(parser):
+	parser.add_argument('--users', type=int, default=100)
+	parser.add_argument('--notes-per-user', type=int, default=20)
+	parser.add_argument('--anonymous-notes', type=int, default=500)
+	parser.add_argument('--text-size', type=int, default=1000,
+						help='mean note body length in characters')
+	parser.add_argument('--text-distribution', default='lognormal',
+						choices=['fixed', 'uniform', 'lognormal'])
+	parser.add_argument('--private-ratio', type=float, default=0.3)
+	parser.add_argument('--grants-per-note', type=float, default=0.1,
+						help='share of private notes shared with one user')
+	parser.add_argument('--seed', type=int, default=1)
+
+
+def seed_from_args(args):
+	return seed(users=args.users, notes_per_user=args.notes_per_user,
+			anonymous_notes=args.anonymous_notes,
+			text_sizes=TextSizes(args.text_size, args.text_distribution),
+			private_ratio=args.private_ratio,
+			grants_per_note=args.grants_per_note, seed_value=args.seed)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__,
+				formatter_class=argparse.RawDescriptionHelpFormatter)
+	add_arguments(parser)
+	args = parser.parse_args()
+
+	url = use_scratch_database()
+	from notes import app
+	with app.app_context():
+		summary = seed_from_args(args)
+	summary['database'] = url
+	print(json.dumps(summary, indent=2))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,88 @@
+"""Measure what deferring and compressing note bodies saves.
+
+    python -m benchmarks.storage_bench --users 100 --notes-per-user 50 \
+        --text-size 3000 --threshold 1024
+
+Seeds a corpus (benchmarks.seed knobs) and reports:
+
+* storage: body bytes as stored against their uncompressed size;
+* bytes read: column bytes fetched by the entity queries of the listing
+  routes with the body deferred, compared with loading it eagerly.
+"""
+import argparse
+import json
+import time
+
+from benchmarks import use_scratch_database
+from benchmarks import seed as seeding
+
+
+def value_bytes(value):
+	if value is None:
+		return 0
+	if isinstance(value, (bytes, bytearray, memoryview)):
+		return len(value)
+	if isinstance(value, str):
+		return len(value.encode('utf-8'))
+	return len(str(value))
+
+
+def fetched_bytes(query):
+	"""Rows and bytes the statement of `query` sends back, and how long."""
+	from notes import db
+	started = time.perf_counter()
+	rows = db.session.execute(query.statement).fetchall()
+	elapsed = time.perf_counter() - started
+	return {
+		'rows': len(rows),
+		'bytes': sum(value_bytes(value) for row in rows for value in row),
+		'ms': 1000 * elapsed,
+	}
+
+
+def listing_queries(per_page):
+	from sqlalchemy.orm import undefer_group
+	from notes.models import Note, UserNoteParams
+	notes = Note.query.order_by(Note.updated.desc(), Note.id.desc())
+	owned = Note.query.join(UserNoteParams, UserNoteParams.note_id == Note.id)\
+				.order_by(UserNoteParams.user_id, Note.id)
+	queries = {}
+	for name, query in (('feed_page', notes.limit(per_page)),
+						('all_notes', notes),
+						('owned_notes', owned)):
+		queries[name] = {
+			'deferred': fetched_bytes(query),
+			'eager': fetched_bytes(query.options(undefer_group('body'))),
+		}
+	return queries
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__,
+				formatter_class=argparse.RawDescriptionHelpFormatter)
+	seeding.add_arguments(parser)
+	parser.add_argument('--threshold', type=int, default=None,
+						help='NOTE_COMPRESS_THRESHOLD for the run')
+	parser.add_argument('--per-page', type=int, default=50)
+	args = parser.parse_args()
+
+	url = use_scratch_database()
+	from notes import app
+	from notes.compression import storage_report
+
+	if args.threshold is not None:
+		app.config['NOTE_COMPRESS_THRESHOLD'] = args.threshold
+	with app.app_context():
+		summary = seeding.seed_from_args(args)
+		report = {
+			'database': url,
+			'population': summary,
+			'threshold': app.config['NOTE_COMPRESS_THRESHOLD'],
+			'storage': storage_report(),
+			'bytes_read': listing_queries(args.per_page),
+		}
+	print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+	main()
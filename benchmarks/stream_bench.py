@@ -0,0 +1,170 @@
+"""Compare streamed and fully rendered listing pages.
+
+    python -m benchmarks.stream_bench --users 4 --notes-per-user 5000 \
+        --anonymous-notes 5000 --per-page 5000 --requests 5
+
+Seeds a corpus once (benchmarks.seed knobs, or --no-seed to reuse
+DATABASE_URL), then measures `index`, `user_notes` and `search` with
+STREAM_TEMPLATES on and off. Every (mode, route) pair runs in its own
+process, so its peak RSS is not inherited from an earlier run. The JSON
+report has time to first byte, time to last byte, body size and peak RSS
+growth over a warmed-up process for each pair.
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+from benchmarks import use_scratch_database
+from benchmarks import seed as seeding
+
+
+MODES = {'streamed': '1', 'buffered': '0'}
+ROUTES = ('index', 'user_notes', 'search')
+
+
+def peak_rss_kb():
+	# VmHWM belongs to this process image; ru_maxrss would also count the
+	# parent's peak, which a child inherits across fork and exec
+	try:
+		with open('/proc/self/status') as status:
+			for line in status:
+				if line.startswith('VmHWM:'):
+					return int(line.split()[1])
+	except OSError:
+		pass
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	# kilobytes on Linux, bytes on macOS
+	return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def reset_peak_rss():
+	# Linux 4.0+: start the high-water mark again from the current RSS
+	try:
+		with open('/proc/self/clear_refs', 'w') as clear_refs:
+			clear_refs.write('5')
+	except OSError:
+		pass
+
+
+def fetch(client, path):
+	"""Milliseconds to the first and last byte of `path`, and its size."""
+	started = time.perf_counter()
+	response = client.get(path)
+	try:
+		chunks = iter(response.response)
+		first = next(chunks, b'')
+		first_byte = time.perf_counter() - started
+		size = len(first) + sum(len(chunk) for chunk in chunks)
+		last_byte = time.perf_counter() - started
+	finally:
+		response.close()
+	return {'status': response.status_code, 'ttfb_ms': 1000 * first_byte,
+			'total_ms': 1000 * last_byte, 'bytes': size}
+
+
+def route_path(route):
+	from notes import db
+	from notes.models import User, UserNoteParams, NoteSearchToken
+	if route == 'index':
+		return '/'
+	if route == 'user_notes':
+		username = db.session.query(User.username)\
+					.join(UserNoteParams, UserNoteParams.user_id == User.id)\
+					.group_by(User.username)\
+					.order_by(db.func.count(UserNoteParams.id).desc())\
+					.limit(1).scalar()
+		return '/user/' + username
+	term = db.session.query(NoteSearchToken.term)\
+				.group_by(NoteSearchToken.term)\
+				.order_by(db.func.count(NoteSearchToken.note_id).desc())\
+				.limit(1).scalar()
+	return '/search?search_query=' + term
+
+
+def measure(route, per_page, requests):
+	"""Run in a child process: STREAM_TEMPLATES comes from the environment."""
+	from notes import app
+	from notes.cache import response_cache
+
+	with app.app_context():
+		path = route_path(route)
+	client = app.test_client()
+
+	# compile templates and fill the pools on a one-row page first
+	app.config['NOTES_PER_PAGE'] = app.config['SEARCH_RESULTS_PER_PAGE'] = 1
+	fetch(client, path)
+	app.config['NOTES_PER_PAGE'] = app.config['SEARCH_RESULTS_PER_PAGE'] = per_page
+	reset_peak_rss()
+	baseline = peak_rss_kb()
+
+	samples = []
+	for _ in range(requests):
+		# a cache hit would only measure replaying the stored body
+		response_cache.backend.clear()
+		samples.append(fetch(client, path))
+	return {
+		'path': path,
+		'status': samples[0]['status'],
+		'bytes': samples[0]['bytes'],
+		'ttfb_ms': min(sample['ttfb_ms'] for sample in samples),
+		'total_ms': min(sample['total_ms'] for sample in samples),
+		'baseline_rss_kb': baseline,
+		'peak_rss_kb': peak_rss_kb(),
+		'rss_growth_kb': peak_rss_kb() - baseline,
+	}
+
+
+def run_child(mode, route, args):
+	env = dict(os.environ, STREAM_TEMPLATES=MODES[mode])
+	output = subprocess.check_output([sys.executable, '-m',
+				'benchmarks.stream_bench', '--measure', route,
+				'--per-page', str(args.per_page),
+				'--requests', str(args.requests)], env=env)
+	return json.loads(output)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__,
+				formatter_class=argparse.RawDescriptionHelpFormatter)
+	seeding.add_arguments(parser)
+	parser.add_argument('--no-seed', action='store_true',
+						help='reuse the population already in DATABASE_URL')
+	parser.add_argument('--per-page', type=int, default=5000,
+						help='NOTES_PER_PAGE and SEARCH_RESULTS_PER_PAGE')
+	parser.add_argument('--requests', type=int, default=5,
+						help='requests per route and mode, best one reported')
+	parser.add_argument('--routes', default=','.join(ROUTES))
+	parser.add_argument('--measure', choices=ROUTES, help=argparse.SUPPRESS)
+	parser.set_defaults(users=4, notes_per_user=5000, anonymous_notes=5000,
+						private_ratio=0.0)
+	args = parser.parse_args()
+
+	url = use_scratch_database()
+	if args.measure:
+		print(json.dumps(measure(args.measure, args.per_page, args.requests)))
+		return
+
+	report = {'database': url, 'per_page': args.per_page,
+			'requests': args.requests, 'routes': {}}
+	if not args.no_seed:
+		from notes import app
+		with app.app_context():
+			report['population'] = seeding.seed_from_args(args)
+
+	for route in args.routes.split(','):
+		results = report['routes'][route] = {mode: run_child(mode, route, args)
+											for mode in MODES}
+		streamed, buffered = results['streamed'], results['buffered']
+		results['ttfb_speedup'] = buffered['ttfb_ms'] / streamed['ttfb_ms'] \
+			if streamed['ttfb_ms'] else None
+		results['rss_growth_saved_kb'] = \
+			buffered['rss_growth_kb'] - streamed['rss_growth_kb']
+	print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,112 @@
+"""Measure the in-memory username index against a LIKE query.
+
+    python -m benchmarks.username_bench --users 100000 --lookups 5000
+
+Fills the users table of a scratch database (or DATABASE_URL) with random
+usernames, loads notes.usernames.username_index from it and reports:
+
+* memory: bytes held by the index per user, from tracemalloc and from
+  `UsernameIndex.memory_usage()`;
+* lookups: p50/p99 microseconds of a prefix lookup of 1 to 4 characters,
+  through the index, through /api/v1/users/suggest and with the
+  `username LIKE 'q%'` query the search page used before.
+"""
+import argparse
+import json
+import random
+import string
+import time
+import tracemalloc
+
+from benchmarks import use_scratch_database
+from benchmarks.load import percentile
+from benchmarks.seed import insert_chunked
+
+
+def random_username(rng):
+	length = rng.randint(4, 16)
+	first = rng.choice(string.ascii_letters)
+	return first + ''.join(rng.choice(string.ascii_letters + string.digits + '_')
+						for _ in range(length - 1))
+
+
+def timed_us(function, prefixes):
+	samples = []
+	for prefix in prefixes:
+		started = time.perf_counter()
+		function(prefix)
+		samples.append(1e6 * (time.perf_counter() - started))
+	samples.sort()
+	return {'p50_us': percentile(samples, 0.50),
+			'p99_us': percentile(samples, 0.99),
+			'mean_us': sum(samples) / len(samples)}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__,
+				formatter_class=argparse.RawDescriptionHelpFormatter)
+	parser.add_argument('--users', type=int, default=100000)
+	parser.add_argument('--lookups', type=int, default=5000)
+	parser.add_argument('--seed', type=int, default=1)
+	args = parser.parse_args()
+
+	url = use_scratch_database()
+	from notes import app, db
+	from notes.models import User
+	from notes.usernames import UsernameIndex
+
+	rng = random.Random(args.seed)
+	with app.app_context():
+		db.drop_all()
+		db.create_all()
+		usernames = list({random_username(rng) for _ in range(args.users)})
+		insert_chunked(User.__table__, [{
+			'username': username,
+			'email': None,
+			'password_hash': 'x',
+		} for username in usernames])
+		db.session.commit()
+		del usernames
+
+		index = UsernameIndex()
+		tracemalloc.start()
+		before = tracemalloc.get_traced_memory()[0]
+		index.refresh()
+		traced = tracemalloc.get_traced_memory()[0] - before
+		tracemalloc.stop()
+
+		names = index.prefix('', len(index))
+		prefixes = [rng.choice(names)[:rng.randint(1, 4)]
+					for _ in range(args.lookups)]
+
+		def like(prefix):
+			escaped = prefix.replace('_', '\\_')
+			db.session.query(User.username)\
+				.filter(User.username.like(escaped + '%', escape='\\'))\
+				.order_by(User.username).limit(10).all()
+
+		report = {
+			'database': url,
+			'users': len(index),
+			'memory': {
+				'traced_bytes': traced,
+				'traced_bytes_per_user': traced / len(index),
+				'index_bytes': index.memory_usage(),
+				'index_bytes_per_user': index.memory_usage() / len(index),
+			},
+			'index': timed_us(lambda prefix: index.prefix(prefix, 10), prefixes),
+			'like_query': timed_us(like, prefixes[:max(1, args.lookups // 10)]),
+		}
+
+	from notes.usernames import username_index
+	username_index.load(names)
+	client = app.test_client()
+	report['suggest_endpoint'] = timed_us(
+		lambda prefix: client.get('/api/v1/users/suggest',
+						query_string={'q': prefix}).get_data(),
+		prefixes[:max(1, args.lookups // 10)])
+	print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+	main()
@@ -4,9 +4,101 @@ from credentials import (
 )
 
 
+def pool_options(prefix):
+	"""Engine pool options from PREFIX_POOL_SIZE, PREFIX_MAX_OVERFLOW, ..."""
+	options = {}
+	for name in ('pool_size', 'max_overflow', 'pool_timeout', 'pool_recycle'):
+		value = os.environ.get('{}_{}'.format(prefix, name.upper()))
+		if value:
+			options[name] = int(value)
+	return options
+
+
 class Config:
 	DEBUG = True
 	SECRET_KEY = os.environ.get('SECRET_KEY') or os.urandom(16)
-	SQLALCHEMY_DATABASE_URI = '{}://{}:{}@{}/{}'.format(
+	SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or \
+				'{}://{}:{}@{}/{}'.format(
 					DB_DIALECT, DB_LOGIN, DB_PASSWORD, DB_HOST, DB_NAME)
 	SQLALCHEMY_TRACK_MODIFICATIONS = False
+	SQLALCHEMY_ENGINE_OPTIONS = pool_options('DATABASE')
+	# read replicas, comma separated; read-only views use them, see
+	# notes/routing.py. Unset keeps every query on the primary.
+	REPLICA_URIS = [uri for uri in
+				os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if uri]
+	SQLALCHEMY_BINDS = {'replica_{}'.format(number): uri
+				for number, uri in enumerate(REPLICA_URIS)}
+	REPLICA_ENGINE_OPTIONS = pool_options('DATABASE_REPLICA')
+	# after a write the client reads from the primary for this long
+	REPLICA_STICKY_SECONDS = 5
+	NOTES_PER_PAGE = int(os.environ.get('NOTES_PER_PAGE', 50))
+	SEARCH_RESULTS_PER_PAGE = 20
+	SEARCH_SNIPPET_LENGTH = 160
+	SEARCH_AUTHORS_PER_PAGE = 50
+	# usernames are kept in memory for prefix search, see notes/usernames.py;
+	# reloaded after this many seconds to see other processes' changes
+	USERNAME_INDEX_TTL = 300
+	USERNAME_SUGGEST_LIMIT = 10
+	CHART_TOP_USERS = 20
+	# /api/v1/stats/activity: range when none is given, largest answer
+	ACTIVITY_DEFAULT_DAYS = 30
+	ACTIVITY_MAX_BUCKETS = 2000
+	# /create hands out signed drafts; a note row is only written on the
+	# first save. Drafts expire after NOTE_DRAFT_MAX_AGE seconds.
+	NOTE_DRAFT_MAX_AGE = 86400
+	NOTE_CREATE_ATTEMPTS = 5
+	# token bucket per user, or per client address for anonymous visitors:
+	# NOTE_CREATE_BURST drafts at once, refilled at NOTE_CREATE_RATE per
+	# second. A burst of 0 turns the limit off.
+	NOTE_CREATE_RATE = float(os.environ.get('NOTE_CREATE_RATE', 0.2))
+	NOTE_CREATE_BURST = int(os.environ.get('NOTE_CREATE_BURST', 10))
+	# batches of the notes API and imports take a token of their own bucket
+	# per request, not per note; their size is bounded by API_MAX_BATCH and
+	# the archive. Same keys, a burst of 0 turns it off as well.
+	NOTE_BULK_CREATE_RATE = float(os.environ.get('NOTE_BULK_CREATE_RATE', 1 / 60))
+	NOTE_BULK_CREATE_BURST = int(os.environ.get('NOTE_BULK_CREATE_BURST', 5))
+	RATE_LIMIT_MAX_KEYS = 10000
+	BULK_DELETE_CHUNK_SIZE = 500
+	BULK_DELETE_SYNC_LIMIT = 2000
+	# notes left empty this many seconds after their last change are swept
+	# by `manage.py sweep_empty_notes`, or every SWEEP_INTERVAL seconds by
+	# the in-app scheduler when that is not 0; see notes/sweeper.py
+	SWEEP_EMPTY_AFTER = 7 * 86400
+	SWEEP_BATCH_SIZE = 500
+	SWEEP_PAUSE = 0.5
+	# deleted notes per second, 0 for no limit beyond the pause
+	SWEEP_RATE = 0
+	SWEEP_INTERVAL = int(os.environ.get('SWEEP_INTERVAL', 0))
+	HTTP_CACHE_MAX_AGE = 60
+	RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND')
+	RESPONSE_CACHE_SIZE = 1024
+	RESPONSE_CACHE_TTL = 300
+	METRICS_SLOW_REQUEST_MS = 500
+	METRICS_SLOW_QUERY_MS = 100
+	IDENTITY_CACHE_SIZE = 4096
+	IDENTITY_CACHE_TTL = 60
+	# stored hashes with other parameters are upgraded on the next login
+	PASSWORD_HASH_METHOD = os.environ.get('PASSWORD_HASH_METHOD',
+								'pbkdf2:sha256:150000')
+	PASSWORD_SALT_LENGTH = 8
+	PASSWORD_HASH_WORKERS = int(os.environ.get('PASSWORD_HASH_WORKERS', 2))
+	PASSWORD_HASH_QUEUE = 16
+	PASSWORD_HASH_TIMEOUT = 10
+	# note bodies over this many bytes are stored zlib compressed
+	NOTE_COMPRESS_THRESHOLD = 1024
+	NOTE_COMPRESS_LEVEL = 6
+	# history: a full snapshot every N revisions, deltas in between
+	NOTE_SNAPSHOT_INTERVAL = 20
+	NOTE_HISTORY_PER_PAGE = 50
+	NOTE_HISTORY_KEEP = 50
+	API_MAX_IDS = 100
+	API_MAX_BATCH = 500
+	API_PER_PAGE = 50
+	EXPORT_BATCH_SIZE = 500
+	IMPORT_CHUNK_SIZE = 500
+	# listing pages are rendered while they are sent, with rows read from
+	# the database STREAM_BATCH_SIZE at a time; see notes/streaming.py
+	STREAM_TEMPLATES = os.environ.get('STREAM_TEMPLATES', '1') != '0'
+	STREAM_BATCH_SIZE = 100
+	# template events per chunk written to the socket
+	STREAM_BUFFER_SIZE = 8
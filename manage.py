@@ -9,5 +9,136 @@ manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
 
+@manager.command
+def reindex_search():
+    """Rebuild the full-text index over every note title and text."""
+    from notes.search import reindex_all
+    reindex_all()
+
+
+@manager.command
+def rebuild_stats():
+    """Recompute the /chart counters from the note tables."""
+    from notes.stats import rebuild_stats
+    rebuild_stats()
+
+
+@manager.command
+def explain_queries():
+    """EXPLAIN the main query of every route; fail on full table scans."""
+    from notes.explain import check_plans
+    failed = False
+    for name, plan, scans in check_plans():
+        print('{}: {}'.format(name, 'FULL SCAN' if scans else 'ok'))
+        for row in plan:
+            print('    {}'.format(row))
+        failed = failed or bool(scans)
+    if failed:
+        raise SystemExit(1)
+
+
+@manager.option('--batch-size', dest='batch_size', type=int, default=500)
+def compress_notes(batch_size=500):
+    """Re-pack note bodies against NOTE_COMPRESS_THRESHOLD in batches."""
+    from notes.compression import compress_notes
+    print('{} notes rewritten'.format(compress_notes(batch_size)))
+
+
+@manager.command
+def storage_report():
+    """Print stored versus uncompressed size of the note bodies."""
+    from notes.compression import storage_report
+    for name, value in storage_report().items():
+        print('{}: {}'.format(name, value))
+
+
+@manager.option('--keep', dest='keep', type=int, default=None)
+def compact_history(keep=None):
+    """Merge note history deltas older than the newest --keep revisions."""
+    from notes.history import compact_history
+    if keep is None:
+        keep = app.config['NOTE_HISTORY_KEEP']
+    notes, removed = compact_history(keep)
+    print('{} notes compacted, {} revisions removed'.format(notes, removed))
+
+
+@manager.option('--chunk-size', dest='chunk_size', type=int, default=None)
+@manager.option('path')
+@manager.option('username')
+def import_notes(username, path, chunk_size=None):
+    """Import an NDJSON or zip export as new notes of USERNAME."""
+    from notes import transfer
+    from notes.models import User
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        raise SystemExit('no user {}'.format(username))
+    with open(path, 'rb') as stream:
+        try:
+            count = transfer.import_notes(user.id, transfer.read_records(stream),
+                        chunk_size or app.config['IMPORT_CHUNK_SIZE'])
+        except transfer.ImportFormatError as error:
+            raise SystemExit('{} ({} notes imported before it)'.format(
+                error, error.imported))
+    print('{} notes imported'.format(count))
+
+
+@manager.option('--quiet', dest='quiet', action='store_true', default=False)
+@manager.option('--dry-run', dest='dry_run', action='store_true',
+                default=False)
+@manager.option('--max-batches', dest='max_batches', type=int, default=None)
+@manager.option('--rate', dest='rate', type=float, default=None)
+@manager.option('--pause', dest='pause', type=float, default=None)
+@manager.option('--batch-size', dest='batch_size', type=int, default=None)
+@manager.option('--older-than', dest='older_than', type=float, default=None)
+def sweep_empty_notes(older_than=None, batch_size=None, pause=None, rate=None,
+                      max_batches=None, dry_run=False, quiet=False):
+    """Delete notes left empty for --older-than days (SWEEP_EMPTY_AFTER)."""
+    from notes.sweeper import sweep_empty_notes
+
+    def progress(report):
+        print('batch {batches}: up to id {last_id} of {max_id}, '
+              '{found} found, {deleted} deleted'.format(**report.as_dict()))
+
+    config = app.config
+    report = sweep_empty_notes(
+        config['SWEEP_EMPTY_AFTER'] if older_than is None
+        else older_than * 86400,
+        batch_size or config['SWEEP_BATCH_SIZE'],
+        config['SWEEP_PAUSE'] if pause is None else pause,
+        config['SWEEP_RATE'] if rate is None else rate,
+        dry_run=dry_run, max_batches=max_batches,
+        progress=None if quiet else progress)
+    print('{} empty notes {} in {} batches, {}s'.format(
+        report.found, 'found' if dry_run else 'deleted', report.batches,
+        report.as_dict()['seconds']))
+
+
+@manager.option('--batch-size', dest='batch_size', type=int, default=1000)
+@manager.option('--end', dest='end', default=None)
+@manager.option('--start', dest='start', default=None)
+def backfill_activity(start=None, end=None, batch_size=1000):
+    """Rebuild the activity rollups of whole weeks from --start to --end.
+
+    Dates are ISO 8601 and move back to their Monday; --end defaults to
+    this week, which is left to the live counts, --start to the first note.
+    """
+    from datetime import datetime
+    from notes import db
+    from notes.activity import backfill_activity, parse_time
+    from notes.models import Note
+    try:
+        end = parse_time(end) if end else datetime.utcnow()
+        start = parse_time(start) if start else \
+            db.session.query(db.func.min(Note.created)).scalar() or end
+    except ValueError as error:
+        raise SystemExit(error)
+
+    def progress(table, rows):
+        print('{}: {} rows read'.format(table, rows))
+
+    written = backfill_activity(start, end, batch_size, progress)
+    print('{} rollup rows written'.format(written))
+
+
 if __name__ == '__main__':
     manager.run()
\ No newline at end of file
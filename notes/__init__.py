@@ -1,10 +1,10 @@
 from flask import Flask
 from config import Config
-from flask_sqlalchemy import SQLAlchemy
+from notes.routing import RoutingSQLAlchemy
 
 app = Flask(__name__)
 app.config.from_object(Config)
-db = SQLAlchemy(app)
+db = RoutingSQLAlchemy(app)
 
-from notes import routes
+from notes import routes, metrics, api, sweeper
 
@@ -0,0 +1,90 @@
+from collections import namedtuple
+from sqlalchemy import and_, null
+from sqlalchemy.orm import Load
+from notes import db
+from .models import User, Note, UserNoteParams, PrivateAccess
+
+
+NotePermissions = namedtuple('NotePermissions',
+					'can_view can_edit can_delete is_owner')
+
+NoteAccess = namedtuple('NoteAccess',
+					'note params owner_username permissions')
+
+ANONYMOUS_NOTE = NotePermissions(True, True, True, False)
+OWNER = NotePermissions(True, True, True, True)
+
+
+def note_permissions(params, viewer_id=None, granted=False):
+	"""What `viewer_id` may do with a note that has `params`.
+
+	Notes without params belong to nobody and are open to everyone.
+	Otherwise the owner may do anything, and other viewers may read public
+	notes (or private ones shared with them through PrivateAccess) and
+	edit them only if the owner allowed changes and did not encrypt it.
+	"""
+	if params is None:
+		return ANONYMOUS_NOTE
+	if viewer_id is not None and params.user_id == viewer_id:
+		return OWNER
+	can_view = not params.private_access or granted
+	can_edit = bool(can_view and params.change_possibility
+					and not params.encryption)
+	return NotePermissions(can_view, can_edit, False, False)
+
+
+def viewer_id_of(user):
+	return user.id if user.is_authenticated else None
+
+
+def note_access_query(url_id, viewer_id=None, with_text=True):
+	return notes_access_query(viewer_id, with_text)\
+				.filter(Note.url_id == url_id)
+
+
+def notes_access_query(viewer_id=None, with_text=True):
+	"""(Note, params, owner username, grant id) rows, unfiltered."""
+	query = db.session.query(Note, UserNoteParams, User.username)\
+				.join(UserNoteParams,
+					UserNoteParams.note_id == Note.id, isouter=True)\
+				.join(User,
+					User.id == UserNoteParams.user_id, isouter=True)
+	if viewer_id is None:
+		query = query.add_columns(null())
+	else:
+		query = query.join(PrivateAccess,
+					and_(PrivateAccess.note_id == Note.id,
+						PrivateAccess.user_id == viewer_id), isouter=True)\
+				.add_columns(PrivateAccess.id)
+	if with_text:
+		query = query.options(Load(Note).undefer_group('body'))
+	return query
+
+
+def resolve_note_access(url_id, user, with_text=True):
+	"""Note, params, owner's username and permissions in one query.
+
+	Returns None when there is no note with `url_id`. With
+	`with_text=False` the body is left unloaded until first accessed.
+	"""
+	viewer_id = viewer_id_of(user)
+	row = note_access_query(url_id, viewer_id, with_text).first()
+	if row is None:
+		return None
+	return note_access(row, viewer_id)
+
+
+def resolve_notes_access(url_ids, user, with_text=True):
+	"""{url_id: NoteAccess} for the notes of `url_ids` that exist."""
+	if not url_ids:
+		return {}
+	viewer_id = viewer_id_of(user)
+	rows = notes_access_query(viewer_id, with_text)\
+				.filter(Note.url_id.in_(url_ids)).all()
+	return {row[0].url_id: note_access(row, viewer_id) for row in rows}
+
+
+def note_access(row, viewer_id):
+	note, params, owner_username, grant_id = row
+	return NoteAccess(note, params, owner_username,
+				note_permissions(params, viewer_id, grant_id is not None))
@@ -0,0 +1,253 @@
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import func
+from notes import db
+from .models import (
+	Note, UserNoteParams, NoteRevision, NoteActivity, AuthorActivity
+)
+from .upsert import increment
+
+
+HOUR, DAY, WEEK = 'hour', 'day', 'week'
+GRANULARITIES = (HOUR, DAY, WEEK)
+# note_activity keeps hours and days, weeks are summed from the days;
+# distinct authors cannot be summed, so author_activity keeps days and weeks
+NOTE_PERIODS = (HOUR, DAY)
+AUTHOR_PERIODS = (DAY, WEEK)
+COUNTS = ('anonymous_notes', 'public_notes', 'private_notes', 'edits')
+
+# Like notes/stats.py, the write helpers only stage UPDATE/INSERT statements
+# in the current session, so the rollups commit or roll back with the write
+# they count. Buckets are UTC; weeks start on Monday.
+
+
+def truncate(when, period):
+	if period == HOUR:
+		return when.replace(minute=0, second=0, microsecond=0)
+	day = when.replace(hour=0, minute=0, second=0, microsecond=0)
+	if period == WEEK:
+		return day - timedelta(days=day.weekday())
+	return day
+
+
+def step(period):
+	return {HOUR: timedelta(hours=1), DAY: timedelta(days=1),
+			WEEK: timedelta(weeks=1)}[period]
+
+
+def parse_time(value):
+	"""Naive UTC datetime of an ISO 8601 date or datetime; ValueError if not."""
+	when = datetime.fromisoformat(value)
+	if when.tzinfo is not None:
+		when = when.astimezone(timezone.utc).replace(tzinfo=None)
+	return when
+
+
+def created_column(user_id, private_access):
+	if user_id is None:
+		return 'anonymous_notes'
+	return 'public_notes' if private_access is False else 'private_notes'
+
+
+class Rollup:
+	"""Activity gathered in memory, then written once per bucket."""
+	def __init__(self):
+		self.notes = defaultdict(Counter)
+		self.authors = Counter()
+
+	def add(self, when, column, user_id=None, count=1):
+		for period in NOTE_PERIODS:
+			self.notes[period, truncate(when, period)][column] += count
+		if user_id is not None:
+			for period in AUTHOR_PERIODS:
+				self.authors[period, truncate(when, period), user_id] += count
+
+	def bump(self):
+		"""Add the counts to the stored rollups."""
+		for (period, bucket), deltas in self.notes.items():
+			bump_activity(period, bucket, deltas)
+		for (period, bucket, user_id), writes in self.authors.items():
+			bump_author(period, bucket, user_id, writes)
+
+	def note_rows(self):
+		for (period, bucket), counts in self.notes.items():
+			row = {name: counts[name] for name in COUNTS}
+			row.update(period=period, bucket=bucket)
+			yield row
+
+	def author_rows(self):
+		for (period, bucket, user_id), writes in self.authors.items():
+			yield {'period': period, 'bucket': bucket, 'user_id': user_id,
+					'writes': writes}
+
+
+# the first writes of a new hour race to create its rows, hence the upserts
+
+def bump_activity(period, bucket, deltas):
+	increment(NoteActivity.__table__, {'period': period, 'bucket': bucket},
+			dict(deltas))
+
+
+def bump_author(period, bucket, user_id, writes=1):
+	increment(AuthorActivity.__table__,
+			{'period': period, 'bucket': bucket, 'user_id': user_id},
+			{'writes': writes})
+
+
+def note_created(user_id=None, private_access=True, when=None):
+	rollup = Rollup()
+	rollup.add(when or datetime.utcnow(),
+				created_column(user_id, private_access), user_id)
+	rollup.bump()
+
+
+def notes_created(user_id, notes):
+	"""`notes` are (created, private_access) pairs of the new notes."""
+	rollup = Rollup()
+	for created, private_access in notes:
+		rollup.add(created, created_column(user_id, private_access), user_id)
+	rollup.bump()
+
+
+def note_edited(user_id=None, when=None):
+	rollup = Rollup()
+	rollup.add(when or datetime.utcnow(), 'edits', user_id)
+	rollup.bump()
+
+
+def forget_user(user_id):
+	db.session.query(AuthorActivity)\
+		.filter(AuthorActivity.user_id == user_id)\
+		.delete(synchronize_session=False)
+
+
+def scan(query, id_column, batch_size):
+	"""Rows of `query` (id first) read in primary key order, `batch_size`
+	at a time."""
+	last_id = 0
+	while True:
+		rows = query.filter(id_column > last_id)\
+					.order_by(id_column).limit(batch_size).all()
+		if not rows:
+			return
+		yield from rows
+		last_id = rows[-1][0]
+
+
+def backfill_activity(start, end, batch_size=1000, progress=None):
+	"""Recompute the rollups of the weeks from `start` to `end`.
+
+	Both are moved back to the Monday of their week, so every bucket
+	rewritten is whole. Notes count where Note.created falls, with their
+	owner's current privacy; edits and authors come from the note history
+	(revisions after the first). Deleted notes, history merged by
+	`compact_history` and authors who deleted their account are gone from
+	those tables, so past buckets can only come out lower than what the
+	write paths counted live. Reads note and note_revision `batch_size`
+	rows at a time in primary key order, calling `progress(table, rows)`
+	after each table, and replaces the rows of the range in one
+	transaction. Returns the number of buckets written.
+	"""
+	start, end = truncate(start, WEEK), truncate(end, WEEK)
+	rollup = Rollup()
+
+	notes = db.session.query(Note.id, Note.created, UserNoteParams.user_id,
+					UserNoteParams.private_access)\
+				.outerjoin(UserNoteParams, UserNoteParams.note_id == Note.id)\
+				.filter(Note.created >= start, Note.created < end)
+	count = 0
+	for _, created, user_id, private_access in scan(notes, Note.id, batch_size):
+		rollup.add(created, created_column(user_id, private_access), user_id)
+		count += 1
+	if progress is not None:
+		progress('note', count)
+
+	edits = db.session.query(NoteRevision.id, NoteRevision.created,
+					NoteRevision.user_id)\
+				.filter(NoteRevision.revision > 1,
+						NoteRevision.created >= start, NoteRevision.created < end)
+	count = 0
+	for _, created, user_id in scan(edits, NoteRevision.id, batch_size):
+		rollup.add(created, 'edits', user_id)
+		count += 1
+	if progress is not None:
+		progress('note_revision', count)
+
+	try:
+		for model, periods in ((NoteActivity, NOTE_PERIODS),
+								(AuthorActivity, AUTHOR_PERIODS)):
+			db.session.query(model)\
+				.filter(model.period.in_(periods),
+						model.bucket >= start, model.bucket < end)\
+				.delete(synchronize_session=False)
+		note_rows, author_rows = list(rollup.note_rows()), \
+					list(rollup.author_rows())
+		for table, rows in ((NoteActivity.__table__, note_rows),
+							(AuthorActivity.__table__, author_rows)):
+			for offset in range(0, len(rows), batch_size):
+				db.session.execute(table.insert(),
+							rows[offset:offset + batch_size])
+		db.session.commit()
+	except:
+		db.session.rollback()
+		raise
+	return len(note_rows) + len(author_rows)
+
+
+def note_activity_query(period, start, stop):
+	return db.session.query(NoteActivity)\
+				.filter(NoteActivity.period == period,
+						NoteActivity.bucket >= start, NoteActivity.bucket < stop)
+
+
+def active_authors_query(period, start, stop):
+	return db.session.query(AuthorActivity.bucket, func.count())\
+				.filter(AuthorActivity.period == period,
+						AuthorActivity.bucket >= start,
+						AuthorActivity.bucket < stop)\
+				.group_by(AuthorActivity.bucket)
+
+
+def buckets(granularity, start, end):
+	"""Starts of the `granularity` buckets overlapping [start, end)."""
+	bucket, size = truncate(start, granularity), step(granularity)
+	while bucket < end:
+		yield bucket
+		bucket += size
+
+
+def activity_series(granularity, start, end):
+	"""One dict per `granularity` bucket overlapping [start, end), empty
+	buckets included.
+
+	Hours and days are rows of note_activity as stored, weeks add up seven
+	days. `active_authors` is the number of distinct users who created or
+	edited a note in the bucket, None for hours.
+	"""
+	series = {bucket: dict.fromkeys(COUNTS, 0)
+				for bucket in buckets(granularity, start, end)}
+	if not series:
+		return []
+	first = min(series)
+	stop = max(series) + step(granularity)
+
+	period = DAY if granularity == WEEK else granularity
+	for row in note_activity_query(period, first, stop):
+		counts = series[truncate(row.bucket, granularity)]
+		for name in COUNTS:
+			counts[name] += getattr(row, name)
+
+	authors = {}
+	if granularity in AUTHOR_PERIODS:
+		authors = dict(active_authors_query(granularity, first, stop).all())
+
+	result = []
+	for bucket in sorted(series):
+		counts = series[bucket]
+		counts['notes_created'] = counts['anonymous_notes'] \
+			+ counts['public_notes'] + counts['private_notes']
+		counts['active_authors'] = authors.get(bucket, 0) \
+			if granularity in AUTHOR_PERIODS else None
+		counts['start'] = bucket.isoformat()
+		result.append(counts)
+	return result
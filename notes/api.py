@@ -0,0 +1,199 @@
+from datetime import datetime, timedelta
+from flask import request, jsonify
+from flask_login import current_user
+from sqlalchemy.exc import IntegrityError
+from notes import app, db
+from .models import Note
+from .access import resolve_notes_access, viewer_id_of
+from .pagination import keyset_page
+from .queries import feed_query, user_notes_query
+from .routes import get_user_by_username, take_bulk_create_token
+from .routing import replica_reads
+from .usernames import username_index
+from . import bulk, stats, activity
+
+
+API_PREFIX = '/api/v1'
+
+
+def note_json(access, with_text=True):
+	"""A note as the API returns it; the body obeys note_view's rules."""
+	note, params, permissions = access.note, access.params, access.permissions
+	data = {
+		'url_id': note.url_id,
+		'title': note.title,
+		'author': access.owner_username,
+		'created': note.created.isoformat() if note.created else None,
+		'updated': note.updated.isoformat() if note.updated else None,
+		'revision': note.revision,
+		'private': bool(params and params.private_access),
+		'permissions': permissions._asdict(),
+	}
+	if with_text and (permissions.is_owner or not (params and params.encryption)):
+		data['text'] = note.text
+	return data
+
+
+def listing_json(row):
+	return {
+		'url_id': row.url_id,
+		'title': row.title,
+		'author': getattr(row, 'username', None),
+		'updated': row.updated.isoformat() if row.updated else None,
+	}
+
+
+@app.route(API_PREFIX + '/notes')
+@replica_reads
+def api_notes():
+	"""`?ids=a,b,c` resolves many notes at once, otherwise a listing page.
+
+	The listing is the public feed, or one user's notes with `?user=`
+	(private ones included for their owner), paged by keyset cursors.
+	"""
+	if 'ids' in request.args:
+		return api_notes_by_ids()
+
+	per_page = min(request.args.get('per_page', app.config['API_PER_PAGE'],
+							type=int), app.config['API_PER_PAGE'])
+	username = request.args.get('user')
+	if username:
+		user = get_user_by_username(username)
+		if not user:
+			return jsonify('404: Not Found'), 404
+		query = user_notes_query(user.id, include_private=
+					current_user.is_authenticated \
+					and current_user.id == user.id,
+					viewer_id=viewer_id_of(current_user))
+	else:
+		query = feed_query()
+	page = keyset_page(query, Note.updated, Note.id,
+				after=request.args.get('after'),
+				before=request.args.get('before'),
+				per_page=max(per_page, 1))
+	notes = [listing_json(row) for row in page]
+	if username:
+		for note in notes:
+			note['author'] = username
+	return jsonify(notes=notes, next=page.next_cursor, prev=page.prev_cursor)
+
+
+def api_notes_by_ids():
+	url_ids = list(dict.fromkeys(url_id for url_id
+				in request.args['ids'].split(',') if url_id))
+	if not url_ids or len(url_ids) > app.config['API_MAX_IDS']:
+		return jsonify('400: Bad Request'), 400
+
+	found = resolve_notes_access(url_ids, current_user)
+	notes, forbidden, missing = [], [], []
+	for url_id in url_ids:
+		access = found.get(url_id)
+		if access is None:
+			missing.append(url_id)
+		elif not access.permissions.can_view:
+			forbidden.append(url_id)
+		else:
+			notes.append(note_json(access))
+	return jsonify(notes=notes, forbidden=forbidden, missing=missing)
+
+
+def batch_notes(items):
+	"""Validated notes for bulk.insert_notes, or None."""
+	notes = []
+	for item in items:
+		if not isinstance(item, dict):
+			return None
+		title, text = item.get('title'), item.get('text', '')
+		if not isinstance(title, str) or not title.strip() or len(title) > 100 \
+				or not isinstance(text, str):
+			return None
+		notes.append({'title': title, 'text': text,
+					'private': bool(item.get('private', True)),
+					'change_possibility': bool(item.get('change_possibility'))})
+	return notes
+
+
+@app.route(API_PREFIX + '/notes/batch', methods=['POST'])
+def api_notes_batch():
+	"""Create many notes in one transaction.
+
+	Body: {"notes": [{"title", "text", "private", "change_possibility"}]}.
+	Notes, their params and search postings go in as one multi-row INSERT
+	each. Only JSON bodies are accepted, which a cross-site form cannot
+	send, so no CSRF token is needed. A batch spends one token of the
+	bulk creation rate limit, shared with imports.
+	"""
+	payload = request.get_json(silent=True)
+	items = payload.get('notes') if isinstance(payload, dict) else None
+	if not isinstance(items, list) or not items \
+			or len(items) > app.config['API_MAX_BATCH']:
+		return jsonify('400: Bad Request'), 400
+	notes = batch_notes(items)
+	if notes is None:
+		return jsonify('400: Bad Request'), 400
+	take_bulk_create_token()
+
+	try:
+		url_ids = bulk.insert_notes(notes, viewer_id_of(current_user))
+		db.session.commit()
+	except IntegrityError:
+		db.session.rollback()
+		return jsonify('409: Conflict'), 409
+
+	return jsonify(notes=[{'url_id': url_id, 'title': note['title']}
+				for url_id, note in zip(url_ids, notes)]), 201
+
+
+@app.route(API_PREFIX + '/users/suggest')
+def api_users_suggest():
+	"""Usernames starting with `?q=` (case-insensitive) for autocomplete.
+
+	Answered from the in-memory username index (notes/usernames.py), so
+	the users table is only read when the index reloads.
+	"""
+	prefix = request.args.get('q', '').strip()
+	limit = min(request.args.get('limit', app.config['USERNAME_SUGGEST_LIMIT'],
+							type=int), app.config['USERNAME_SUGGEST_LIMIT'])
+	if not prefix or len(prefix) > 30:
+		return jsonify(users=[])
+	return jsonify(users=username_index.prefix(prefix, max(limit, 1)))
+
+
+@app.route(API_PREFIX + '/stats/notes')
+@replica_reads
+def api_note_stats():
+	"""Anonymous and user note counts and the top authors, from counters."""
+	anonymous_notes, user_notes = stats.notes_type_counts()
+	authors = stats.top_authors(app.config['CHART_TOP_USERS'])
+	return jsonify(anonymous_notes=anonymous_notes, user_notes=user_notes,
+				top_authors=[{'username': username, 'notes': notes_count}
+							for username, notes_count in authors])
+
+
+@app.route(API_PREFIX + '/stats/activity')
+@replica_reads
+def api_activity():
+	"""Notes created and edited and active authors over time.
+
+	`?granularity=hour|day|week` (default day), `start` and `end` as ISO
+	8601 dates or datetimes, UTC unless an offset is given, end excluded;
+	by default the last ACTIVITY_DEFAULT_DAYS days. Answered from the
+	rollups of notes/activity.py, at most ACTIVITY_MAX_BUCKETS buckets.
+	"""
+	granularity = request.args.get('granularity', activity.DAY)
+	try:
+		end = activity.parse_time(request.args['end']) \
+			if request.args.get('end') else datetime.utcnow()
+		start = activity.parse_time(request.args['start']) \
+			if request.args.get('start') \
+			else end - timedelta(days=app.config['ACTIVITY_DEFAULT_DAYS'])
+	except ValueError:
+		return jsonify('400: Bad Request'), 400
+	if granularity not in activity.GRANULARITIES or start >= end \
+			or (end - start) / activity.step(granularity) \
+				> app.config['ACTIVITY_MAX_BUCKETS']:
+		return jsonify('400: Bad Request'), 400
+	return jsonify(granularity=granularity, start=start.isoformat(),
+				end=end.isoformat(),
+				buckets=activity.activity_series(granularity, start, end))
+
@@ -0,0 +1,267 @@
+import threading
+from datetime import datetime
+from secrets import token_hex, choice as sec_choice
+from string import digits, ascii_letters
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from notes import app, db
+from .models import (
+	User, Note, UserNoteParams, PrivateAccess, UserNoteStats
+)
+from .search import unindex_notes, index_new_notes, index_note
+from .compression import pack_text
+from .deltas import normalize_newlines
+from .history import add_revision, delete_history, forget_author
+from .cache import response_cache
+from .identity import forget_principal
+from .usernames import username_index
+from . import stats, activity
+
+
+def generate_url_id():
+	alphabet = digits + ascii_letters.upper() + digits + ascii_letters
+	url_id = ''.join(sec_choice(alphabet) for i in range(9))
+	return url_id
+
+
+def unused_url_ids(count):
+	url_ids = set()
+	while len(url_ids) < count:
+		candidates = {generate_url_id() for i in range(count - len(url_ids))}
+		taken = {url_id for url_id, in db.session.query(Note.url_id)
+					.filter(Note.url_id.in_(candidates))}
+		url_ids |= candidates - taken
+	return list(url_ids)
+
+
+def create_note(url_id, title, text, user_id=None, params=None, attempts=5):
+	"""Write a draft saved for the first time, and commit.
+
+	The note, its params (when `user_id` is given), the first history
+	snapshot, search postings and counters go in one transaction. The
+	draft only reserved `url_id` in its token, so if another note took it
+	meanwhile the transaction is retried with a fresh one; check
+	`note.url_id` afterwards. `params` may set private_access,
+	change_possibility and encryption.
+	"""
+	text = normalize_newlines(text)
+	for attempt in range(attempts):
+		note = Note(url_id=url_id, title=title, text=text)
+		try:
+			db.session.add(note)
+			db.session.flush()
+			private_access = True
+			if user_id is not None:
+				owner = UserNoteParams(note_id=note.id, user_id=user_id,
+										**(params or {}))
+				db.session.add(owner)
+				private_access = owner.private_access is not False
+			add_revision(note.id, note.revision, title, text, user_id)
+			index_note(note)
+			stats.note_created(user_id, private_access)
+			activity.note_created(user_id, private_access, note.created)
+			response_cache.invalidate_feed()
+			db.session.commit()
+			return note
+		except IntegrityError:
+			db.session.rollback()
+			taken = db.session.query(Note.id)\
+						.filter(Note.url_id == url_id).first()
+			if taken is None or attempt + 1 == attempts:
+				raise
+			url_id = generate_url_id()
+
+
+def insert_notes(notes, user_id=None):
+	"""Multi-row INSERTs of new notes, their params and search postings.
+
+	`notes` are dicts with title and text, optionally private,
+	change_possibility, encryption, created and updated. Every note gets a
+	fresh url_id; params are only written when `user_id` is given.
+	Stages the statements in the current transaction; the caller commits.
+	Returns the url_ids in the order of `notes`.
+	"""
+	if not notes:
+		return []
+	now = datetime.utcnow()
+	url_ids = unused_url_ids(len(notes))
+	note_rows = []
+	for url_id, note in zip(url_ids, notes):
+		text, text_z = pack_text(normalize_newlines(note.get('text')))
+		note_rows.append({'url_id': url_id, 'title': note['title'],
+						'text': text, 'text_z': text_z, 'revision': 1,
+						'created': note.get('created') or now,
+						'updated': note.get('updated') or now})
+	db.session.execute(Note.__table__.insert(), note_rows)
+	ids = dict(db.session.query(Note.url_id, Note.id)
+				.filter(Note.url_id.in_(url_ids)))
+
+	public = 0
+	if user_id is not None:
+		params = [{
+			'note_id': ids[url_id],
+			'user_id': user_id,
+			'private_access': note.get('private', True),
+			'change_possibility': note.get('change_possibility', False),
+			'encryption': note.get('encryption', False),
+		} for url_id, note in zip(url_ids, notes)]
+		db.session.execute(UserNoteParams.__table__.insert(), params)
+		public = sum(not row['private_access'] for row in params)
+	stats.notes_created(user_id, len(notes), public)
+	activity.notes_created(user_id, ((row['created'], note.get('private', True))
+				for row, note in zip(note_rows, notes)))
+	index_new_notes((ids[url_id], note['title'], note.get('text'))
+				for url_id, note in zip(url_ids, notes))
+	response_cache.invalidate_feed()
+	return url_ids
+
+
+def delete_notes(note_ids):
+	"""Set-based delete of notes and every row hanging off them.
+
+	Stages the statements in the current transaction; the caller commits.
+	Keep `note_ids` to a few hundred ids per call.
+	"""
+	if not note_ids:
+		return 0
+	owners = db.session.query(UserNoteParams.user_id,
+					UserNoteParams.private_access,
+					func.count(UserNoteParams.id))\
+				.filter(UserNoteParams.note_id.in_(note_ids))\
+				.group_by(UserNoteParams.user_id,
+					UserNoteParams.private_access).all()
+
+	for url_id, in db.session.query(Note.url_id).filter(Note.id.in_(note_ids)):
+		response_cache.invalidate_note(url_id)
+	response_cache.invalidate_feed()
+
+	unindex_notes(note_ids)
+	delete_history(note_ids)
+	db.session.query(PrivateAccess)\
+		.filter(PrivateAccess.note_id.in_(note_ids))\
+		.delete(synchronize_session=False)
+	db.session.query(UserNoteParams)\
+		.filter(UserNoteParams.note_id.in_(note_ids))\
+		.delete(synchronize_session=False)
+	deleted = db.session.query(Note)\
+				.filter(Note.id.in_(note_ids))\
+				.delete(synchronize_session=False)
+
+	owned = 0
+	for user_id, private_access, count in owners:
+		owned += count
+		stats.bump_counter(stats.USER_NOTES, -count)
+		stats.bump_user_stats(user_id, -count,
+							0 if private_access else -count)
+	if deleted > owned:
+		stats.bump_counter(stats.ANONYMOUS_NOTES, owned - deleted)
+	return deleted
+
+
+def user_note_ids(user_id, limit):
+	return [note_id for note_id, in db.session.query(UserNoteParams.note_id)
+				.filter(UserNoteParams.user_id == user_id)
+				.order_by(UserNoteParams.note_id).limit(limit)]
+
+
+def count_user_notes(user_id):
+	return db.session.query(func.count(UserNoteParams.id))\
+				.filter(UserNoteParams.user_id == user_id).scalar()
+
+
+def delete_user_rows(user_id):
+	username = db.session.query(User.username)\
+				.filter(User.id == user_id).scalar()
+	if username is not None:
+		username_index.removed(username)
+	forget_author(user_id)
+	activity.forget_user(user_id)
+	db.session.query(PrivateAccess)\
+		.filter(PrivateAccess.user_id == user_id)\
+		.delete(synchronize_session=False)
+	db.session.query(UserNoteStats)\
+		.filter(UserNoteStats.user_id == user_id)\
+		.delete(synchronize_session=False)
+	db.session.query(User)\
+		.filter(User.id == user_id)\
+		.delete(synchronize_session=False)
+
+
+def delete_user(user_id, chunk_size=500):
+	"""Delete a user with all their notes in a single transaction."""
+	try:
+		while True:
+			note_ids = user_note_ids(user_id, chunk_size)
+			if not note_ids:
+				break
+			delete_notes(note_ids)
+		delete_user_rows(user_id)
+		db.session.commit()
+	except:
+		db.session.rollback()
+		raise
+
+
+class DeletionJob:
+	"""Chunked background deletion of a large account.
+
+	Each chunk commits on its own, so an interrupted job leaves no orphaned
+	rows and can simply be started again.
+	"""
+	def __init__(self, user_id, total, chunk_size):
+		self.id = token_hex(8)
+		self.user_id = user_id
+		self.total = total
+		self.chunk_size = chunk_size
+		self.done = 0
+		self.status = 'pending'
+		self.error = None
+
+	def as_dict(self):
+		return {
+			'id': self.id,
+			'status': self.status,
+			'total': self.total,
+			'done': self.done,
+			'error': self.error,
+		}
+
+	def run(self):
+		self.status = 'running'
+		with app.app_context():
+			try:
+				while True:
+					note_ids = user_note_ids(self.user_id, self.chunk_size)
+					if not note_ids:
+						break
+					self.done += delete_notes(note_ids)
+					db.session.commit()
+				delete_user_rows(self.user_id)
+				db.session.commit()
+				forget_principal(self.user_id)
+				self.status = 'finished'
+			except Exception as error:
+				db.session.rollback()
+				self.status = 'failed'
+				self.error = str(error)
+				app.logger.exception('deletion job %s failed', self.id)
+			finally:
+				db.session.remove()
+
+
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+
+def start_deletion_job(user_id, total, chunk_size=500):
+	job = DeletionJob(user_id, total, chunk_size)
+	with _jobs_lock:
+		_jobs[job.id] = job
+	threading.Thread(target=job.run, name='delete-user-{}'.format(user_id),
+					daemon=True).start()
+	return job
+
+
+def get_deletion_job(job_id):
+	with _jobs_lock:
+		return _jobs.get(job_id)
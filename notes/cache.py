@@ -0,0 +1,192 @@
+import threading
+from secrets import token_hex
+from collections import OrderedDict
+from time import monotonic
+from flask import request, make_response
+from flask_login import current_user
+from sqlalchemy import event
+from werkzeug.utils import import_string
+from notes import app, db
+from .http_cache import has_pending_flashes, is_not_modified, set_validators
+
+
+class CacheBackend:
+	"""Storage interface for the response cache.
+
+	A shared backend (memcached, redis, ...) only has to implement these
+	four methods; values are plain tuples of bytes/str/datetime/bool.
+	"""
+	def get(self, key):
+		raise NotImplementedError
+
+	def set(self, key, value):
+		raise NotImplementedError
+
+	def delete(self, key):
+		raise NotImplementedError
+
+	def clear(self):
+		raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+	"""In-process cache bounded by entry count and per-entry TTL."""
+	def __init__(self, maxsize=1024, ttl=300):
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self._data = OrderedDict()
+		self._lock = threading.Lock()
+
+	def get(self, key):
+		with self._lock:
+			entry = self._data.get(key)
+			if entry is None:
+				return None
+			expires, value = entry
+			if expires < monotonic():
+				del self._data[key]
+				return None
+			self._data.move_to_end(key)
+			return value
+
+	def set(self, key, value):
+		with self._lock:
+			self._data[key] = (monotonic() + self.ttl, value)
+			self._data.move_to_end(key)
+			while len(self._data) > self.maxsize:
+				self._data.popitem(last=False)
+
+	def delete(self, key):
+		with self._lock:
+			self._data.pop(key, None)
+
+	def clear(self):
+		with self._lock:
+			self._data.clear()
+
+	def __len__(self):
+		return len(self._data)
+
+
+FEED_GENERATION = 'index:generation'
+
+
+class ResponseCache:
+	"""Rendered pages for anonymous viewers, keyed by route and argument.
+
+	Every anonymous viewer has the same permissions, so their pages can be
+	shared; logged-in viewers and pages with pending flashes bypass the
+	cache entirely. Invalidations requested inside a transaction are
+	applied once it commits.
+	"""
+	def __init__(self, app=None):
+		self.backend = None
+		self.hits = 0
+		self.misses = 0
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		backend = app.config['RESPONSE_CACHE_BACKEND']
+		if backend:
+			self.backend = import_string(backend)(app)
+		else:
+			self.backend = LRUCache(app.config['RESPONSE_CACHE_SIZE'],
+								app.config['RESPONSE_CACHE_TTL'])
+		event.listen(db.session, 'after_commit', self._after_commit)
+		event.listen(db.session, 'after_rollback', self._after_rollback)
+
+	def stats(self):
+		return {'hits': self.hits, 'misses': self.misses}
+
+	def is_cacheable(self):
+		return request.method == 'GET' and current_user.is_anonymous \
+			and not has_pending_flashes()
+
+	def note_key(self, url_id):
+		return 'note_view:{}'.format(url_id)
+
+	def feed_key(self, after, before):
+		generation = self.backend.get(FEED_GENERATION)
+		if generation is None:
+			generation = self._new_feed_generation()
+		return 'index:{}:{}:{}'.format(generation, after or '', before or '')
+
+	def serve(self, key, build):
+		"""Cached page for `key`, or `build()` stored when it is a 200."""
+		if not self.is_cacheable():
+			return make_response(build())
+		entry = self.backend.get(key)
+		if entry is not None:
+			self.hits += 1
+			return self._replay(entry)
+		self.misses += 1
+		# a lagging replica would store the page an invalidation just
+		# retired, for everyone and for the whole TTL
+		db.use_primary()
+		response = make_response(build())
+		if response.status_code == 200 and response.get_etag()[0]:
+			validators = (response.get_etag()[0], response.last_modified,
+						bool(response.cache_control.public))
+			if response.is_streamed:
+				response.response = self._tee(key, response.response,
+									response.charset, validators)
+			else:
+				self.backend.set(key, (response.get_data(),) + validators)
+		return response
+
+	def _tee(self, key, body, charset, validators):
+		# store a streamed page once all of it has been sent; a client
+		# hanging up halfway closes the generator and nothing is stored
+		chunks = []
+		try:
+			for chunk in body:
+				if isinstance(chunk, str):
+					chunk = chunk.encode(charset)
+				chunks.append(chunk)
+				yield chunk
+		finally:
+			if hasattr(body, 'close'):
+				body.close()
+		self.backend.set(key, (b''.join(chunks),) + validators)
+
+	def _replay(self, entry):
+		body, etag, last_modified, public = entry
+		if is_not_modified(etag, last_modified):
+			response = app.response_class(status=304)
+		else:
+			response = app.response_class(body, mimetype='text/html')
+		return set_validators(response, etag, last_modified, public)
+
+	def invalidate_note(self, url_id):
+		self._schedule(self.note_key(url_id))
+
+	def invalidate_feed(self):
+		# feed pages shift on any change, so retire the whole generation
+		self._schedule(FEED_GENERATION)
+
+	def _new_feed_generation(self):
+		# random rather than incremented, so an evicted generation key can
+		# never bring back pages of an older one
+		generation = token_hex(4)
+		self.backend.set(FEED_GENERATION, generation)
+		return generation
+
+	def _schedule(self, key):
+		db.session.info.setdefault('cache_invalidations', set()).add(key)
+
+	def _invalidate(self, key):
+		if key == FEED_GENERATION:
+			self._new_feed_generation()
+		else:
+			self.backend.delete(key)
+
+	def _after_commit(self, session):
+		for key in session.info.pop('cache_invalidations', ()):
+			self._invalidate(key)
+
+	def _after_rollback(self, session):
+		session.info.pop('cache_invalidations', None)
+
+
+response_cache = ResponseCache(app)
@@ -0,0 +1,92 @@
+import zlib
+from sqlalchemy import func
+from notes import app, db
+
+
+def pack_text(text):
+	"""(text, text_z) column values for a note body.
+
+	Bodies longer than NOTE_COMPRESS_THRESHOLD bytes are stored zlib
+	compressed in `text_z` with `text` left NULL, unless compressing does
+	not make them smaller.
+	"""
+	if text is None:
+		return None, None
+	raw = text.encode('utf-8')
+	if len(raw) <= app.config['NOTE_COMPRESS_THRESHOLD']:
+		return text, None
+	packed = zlib.compress(raw, app.config['NOTE_COMPRESS_LEVEL'])
+	if len(packed) >= len(raw):
+		return text, None
+	return None, packed
+
+
+def unpack_text(text, text_z):
+	if text_z is not None:
+		return zlib.decompress(text_z).decode('utf-8')
+	return text
+
+
+def compress_notes(batch_size=500):
+	"""Move plain bodies over the threshold into `text_z`, one batch per commit.
+
+	Also the way back: compressed bodies that no longer qualify (after the
+	threshold was raised) are stored plain again. Returns rows rewritten.
+	"""
+	from .models import Note
+	rewritten = 0
+	last_id = 0
+	while True:
+		rows = db.session.query(Note.id, Note._text, Note.text_z)\
+					.filter(Note.id > last_id)\
+					.order_by(Note.id).limit(batch_size).all()
+		if not rows:
+			break
+		updates = []
+		for note_id, text, text_z in rows:
+			packed = pack_text(unpack_text(text, text_z))
+			if packed != (text, text_z):
+				updates.append({'note_id': note_id,
+								'text': packed[0], 'text_z': packed[1]})
+		if updates:
+			table = Note.__table__
+			db.session.execute(table.update()
+					.where(table.c.id == db.bindparam('note_id'))
+					.values(text=db.bindparam('text'),
+						text_z=db.bindparam('text_z')), updates)
+		db.session.commit()
+		rewritten += len(updates)
+		last_id = rows[-1][0]
+	return rewritten
+
+
+def storage_report(batch_size=500):
+	"""Bytes the note bodies take as stored versus uncompressed."""
+	from .models import Note
+	stored = db.session.query(
+				func.count(Note.id),
+				func.count(Note.text_z),
+				func.coalesce(func.sum(func.length(Note._text)), 0),
+				func.coalesce(func.sum(func.length(Note.text_z)), 0)).one()
+	notes, compressed, plain_bytes, packed_bytes = stored
+	# the uncompressed size of packed bodies needs them unpacked
+	unpacked_bytes = 0
+	last_id = 0
+	while True:
+		rows = db.session.query(Note.id, Note.text_z)\
+					.filter(Note.id > last_id, Note.text_z != None)\
+					.order_by(Note.id).limit(batch_size).all()
+		if not rows:
+			break
+		unpacked_bytes += sum(len(zlib.decompress(text_z)) for _, text_z in rows)
+		last_id = rows[-1][0]
+	raw_bytes = plain_bytes + unpacked_bytes
+	stored_bytes = plain_bytes + packed_bytes
+	return {
+		'notes': notes,
+		'compressed_notes': compressed,
+		'raw_bytes': raw_bytes,
+		'stored_bytes': stored_bytes,
+		'saved_bytes': raw_bytes - stored_bytes,
+		'ratio': stored_bytes / raw_bytes if raw_bytes else None,
+	}
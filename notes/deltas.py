@@ -0,0 +1,79 @@
+"""Text deltas sent by the editor's autosave and kept in note history.
+
+A delta is a list of ops applied in order to the text of the base
+revision, positions counted in characters of the text as it is after the
+previous ops:
+
+	{"op": "insert", "pos": 10, "text": "abc"}
+	{"op": "delete", "pos": 4, "count": 2}
+"""
+
+from difflib import SequenceMatcher
+
+MAX_OPS = 100
+
+
+class DeltaError(ValueError):
+	pass
+
+
+def _position(op, name, upper):
+	value = op.get(name)
+	if not isinstance(value, int) or isinstance(value, bool) \
+			or not 0 <= value <= upper:
+		raise DeltaError('{} out of range: {!r}'.format(name, value))
+	return value
+
+
+def normalize_newlines(text):
+	"""`text` with LF line breaks only.
+
+	Browsers submit a textarea with CRLF in a form POST, but the editor
+	counts delta positions on its value, which uses LF. Text is stored
+	normalized so both agree.
+	"""
+	if not text:
+		return text
+	return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def apply_ops(text, ops, max_ops=MAX_OPS):
+	"""New text after `ops`; raises DeltaError on a malformed delta."""
+	if not isinstance(ops, list) or (max_ops is not None and len(ops) > max_ops):
+		raise DeltaError('ops must be a list of at most {}'.format(max_ops))
+	parts = text or ''
+	for op in ops:
+		if not isinstance(op, dict):
+			raise DeltaError('op must be an object')
+		kind = op.get('op')
+		if kind == 'insert':
+			pos = _position(op, 'pos', len(parts))
+			insert = op.get('text')
+			if not isinstance(insert, str):
+				raise DeltaError('insert needs text')
+			parts = parts[:pos] + insert + parts[pos:]
+		elif kind == 'delete':
+			pos = _position(op, 'pos', len(parts))
+			count = _position(op, 'count', len(parts) - pos)
+			parts = parts[:pos] + parts[pos + count:]
+		else:
+			raise DeltaError('unknown op {!r}'.format(kind))
+	return parts
+
+
+def diff_ops(before, after):
+	"""Ops turning `before` into `after`, diffed line by line."""
+	before_lines = (before or '').splitlines(True)
+	after_lines = (after or '').splitlines(True)
+	matcher = SequenceMatcher(None, before_lines, after_lines, autojunk=False)
+	ops = []
+	pos = 0
+	for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+		if tag in ('replace', 'delete'):
+			ops.append({'op': 'delete', 'pos': pos,
+						'count': sum(map(len, before_lines[i1:i2]))})
+		if tag in ('replace', 'insert'):
+			ops.append({'op': 'insert', 'pos': pos,
+						'text': ''.join(after_lines[j1:j2])})
+		pos += sum(map(len, after_lines[j1:j2]))
+	return ops
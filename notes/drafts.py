@@ -0,0 +1,24 @@
+from itsdangerous import URLSafeTimedSerializer, BadSignature
+from notes import app
+
+
+# A draft is a url_id reserved for one viewer, signed into the edit link
+# by /create. Nothing is written until the first save in note_edit.
+_serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'],
+								salt='note-draft')
+
+
+def draft_token(url_id, user_id=None):
+	return _serializer.dumps([url_id, user_id])
+
+
+def is_draft_of(token, url_id, user_id=None):
+	"""True when `token` reserves `url_id` for `user_id` and is not expired."""
+	if not token:
+		return False
+	try:
+		reserved = _serializer.loads(token,
+						max_age=app.config['NOTE_DRAFT_MAX_AGE'])
+	except BadSignature:
+		return False
+	return reserved == [url_id, user_id]
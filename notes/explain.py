@@ -0,0 +1,90 @@
+from datetime import datetime, timedelta
+from notes import db
+from .models import Note, PrivateAccess
+from .pagination import keyset_query
+from .queries import (
+	feed_query, feed_probe_query, user_notes_query, shared_notes_query,
+	note_grants_query
+)
+from .search import search_query
+from .access import note_access_query, notes_access_query
+from .stats import notes_type_counts_query, top_authors_query
+from .activity import note_activity_query, active_authors_query
+
+
+def hot_queries():
+	"""(name, query) for the main query of every route, with sample args."""
+	cursor = (datetime.utcnow(), 1)
+	return [
+		('index', keyset_query(feed_query(), Note.updated, Note.id, limit=51)),
+		('index next page', keyset_query(feed_query(), Note.updated, Note.id,
+							after=cursor, limit=51)),
+		('index prev page', keyset_query(feed_query(), Note.updated, Note.id,
+							before=cursor, limit=51)),
+		('index probe', keyset_query(feed_probe_query(), Note.updated, Note.id,
+							limit=51)),
+		('search', search_query(['note', 'plan'], viewer_id=1).limit(21)),
+		('user_notes', keyset_query(user_notes_query(1), Note.updated, Note.id,
+							limit=51)),
+		('user_notes owner', keyset_query(user_notes_query(1, True),
+							Note.updated, Note.id, limit=51)),
+		('user_notes with grants', keyset_query(user_notes_query(1,
+							viewer_id=2), Note.updated, Note.id, limit=51)),
+		('shared with me', shared_notes_query(1).filter(PrivateAccess.id < 1000)
+							.order_by(PrivateAccess.id.desc()).limit(51)),
+		('note grants', note_grants_query(1)),
+		('chart counters', notes_type_counts_query()),
+		('chart authors', top_authors_query(20)),
+		('activity per day', note_activity_query('day', cursor[0],
+							cursor[0] + timedelta(days=30))),
+		('active authors per week', active_authors_query('week', cursor[0],
+							cursor[0] + timedelta(weeks=12))),
+		('note access', note_access_query('abcdefghi')),
+		('note access as user', note_access_query('abcdefghi', viewer_id=1)),
+		('api notes by ids', notes_access_query(viewer_id=1)
+							.filter(Note.url_id.in_(['abcdefghi', 'jklmnopqr']))),
+	]
+
+
+def explain(query):
+	"""Plan rows of `query` as reported by the database's EXPLAIN."""
+	connection = db.session.connection()
+	dialect = connection.dialect
+	compiled = query.statement.compile(dialect=dialect)
+	if compiled.positional:
+		params = [compiled.params[name] for name in compiled.positiontup]
+	else:
+		params = compiled.params
+	prefix = 'EXPLAIN QUERY PLAN ' if dialect.name == 'sqlite' else 'EXPLAIN '
+	result = connection.execute(prefix + str(compiled), params)
+	return [dict(zip(result.keys(), row)) for row in result]
+
+
+def full_scans(dialect_name, plan):
+	"""Plan rows that read a whole table instead of seeking an index."""
+	if dialect_name == 'sqlite':
+		# "SCAN note" is a table scan, "SCAN note USING INDEX ..." walks an
+		# index in order (and stops at LIMIT); scanning the small result of
+		# a materialized subquery is fine
+		details = [row['detail'].replace('SCAN TABLE ', 'SCAN ')
+				.replace('SEARCH TABLE ', 'SEARCH ') for row in plan]
+		derived = {detail.split()[-1] for detail in details
+				if detail.startswith(('MATERIALIZE', 'CO-ROUTINE'))}
+		return [row for row, detail in zip(plan, details)
+				if detail.startswith('SCAN ')
+				and 'USING' not in detail
+				and detail.split()[1] not in derived
+				and detail != 'SCAN CONSTANT ROW']
+	return [row for row in plan
+			if row.get('type') == 'ALL'
+			and not str(row.get('table', '')).startswith('<')]
+
+
+def check_plans():
+	"""[(name, plan, scans)] for every hot query."""
+	dialect_name = db.session.connection().dialect.name
+	report = []
+	for name, query in hot_queries():
+		plan = explain(query)
+		report.append((name, plan, full_scans(dialect_name, plan)))
+	return report
@@ -1,15 +1,18 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileRequired
 from wtforms import (
 		StringField,
 		TextAreaField,
 		SubmitField,
 		PasswordField,
 		BooleanField,
-		RadioField
+		RadioField,
+		IntegerField
 	)
 from wtforms.fields.html5 import EmailField
+from wtforms.widgets import HiddenInput
 from wtforms.validators import (
-		DataRequired, EqualTo, Length
+		DataRequired, EqualTo, Length, Optional
 	)
 
 
@@ -17,6 +20,7 @@ class NoteForm(FlaskForm):
 	title = StringField('Title', validators=[DataRequired(),
 										Length(max=100)])
 	text = TextAreaField('Text')
+	revision = IntegerField(widget=HiddenInput(), validators=[Optional()])
 	save = SubmitField('Save')
 	publish = SubmitField('Publish')
 
@@ -27,9 +31,31 @@ class UserNoteParamsForm(FlaskForm):
 	change_possibility = BooleanField('change possibility')
 
 
+class RestoreForm(FlaskForm):
+	submit = SubmitField('Restore')
+
+
+class ShareForm(FlaskForm):
+	username = StringField('Share with', validators=[DataRequired(),
+										Length(max=30)])
+	submit = SubmitField('Share')
+
+
+class RevokeForm(FlaskForm):
+	submit = SubmitField('Revoke')
+
+
+class ImportForm(FlaskForm):
+	archive = FileField('Export file (.ndjson or .zip)', validators=[FileRequired()])
+	submit = SubmitField('Import')
+
+
 class SearchForm(FlaskForm):
 	search_query = StringField('Query', validators=[DataRequired(),
 										Length(max=100)])
+	mode = RadioField('Search in', choices=[('notes', 'Notes'),
+										('authors', 'Authors')],
+					default='notes', validators=[Optional()])
 	submit = SubmitField('Search')
 
 
@@ -0,0 +1,90 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as HashTimeout
+from werkzeug.security import generate_password_hash, check_password_hash
+from notes import app
+
+
+class HashingBusy(Exception):
+	"""Every worker is busy and the wait queue is full, or a hash did not
+	finish within PASSWORD_HASH_TIMEOUT seconds."""
+
+
+class PasswordHasher:
+	"""Runs password hashing off the web worker in a bounded process pool.
+
+	At most `workers + queue` hashes are in flight; anything beyond that is
+	refused with HashingBusy straight away instead of piling up behind a
+	burst of logins. A hash that outlives the timeout raises HashingBusy
+	too, but keeps its slot until the worker is done with it. With
+	PASSWORD_HASH_WORKERS = 0 hashing runs inline.
+	"""
+	def __init__(self, app=None):
+		self.method = 'pbkdf2:sha256'
+		self.salt_length = 8
+		self.workers = 0
+		self.timeout = None
+		self._slots = None
+		self._executor = None
+		self._pid = None
+		self._lock = threading.Lock()
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		self.shutdown()
+		self.method = app.config['PASSWORD_HASH_METHOD']
+		self.salt_length = app.config['PASSWORD_SALT_LENGTH']
+		self.workers = app.config['PASSWORD_HASH_WORKERS']
+		self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+		self._slots = threading.BoundedSemaphore(
+				self.workers + app.config['PASSWORD_HASH_QUEUE'])
+
+	def executor(self):
+		# created lazily and per process, so forked web workers get their own
+		with self._lock:
+			if self._executor is None or self._pid != os.getpid():
+				self._executor = ProcessPoolExecutor(max_workers=self.workers)
+				self._pid = os.getpid()
+			return self._executor
+
+	def shutdown(self):
+		with self._lock:
+			if self._executor is not None and self._pid == os.getpid():
+				self._executor.shutdown()
+			self._executor = None
+
+	def run(self, function, *args):
+		if not self._slots.acquire(blocking=False):
+			raise HashingBusy()
+		if not self.workers:
+			try:
+				return function(*args)
+			finally:
+				self._slots.release()
+		try:
+			future = self.executor().submit(function, *args)
+		except:
+			self._slots.release()
+			raise
+		future.add_done_callback(lambda _: self._slots.release())
+		try:
+			return future.result(self.timeout)
+		except HashTimeout:
+			raise HashingBusy()
+
+	def hash(self, password):
+		return self.run(generate_password_hash, password,
+						self.method, self.salt_length)
+
+	def verify(self, password_hash, password):
+		return self.run(check_password_hash, password_hash, password)
+
+	def needs_rehash(self, password_hash):
+		# werkzeug hashes look like "pbkdf2:sha256:150000$salt$hash"
+		method, _, rest = password_hash.partition('$')
+		salt = rest.partition('$')[0]
+		return method != self.method or len(salt) != self.salt_length
+
+
+password_hasher = PasswordHasher(app)
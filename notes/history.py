@@ -0,0 +1,150 @@
+import json
+import zlib
+from sqlalchemy import func
+from notes import app, db
+from .models import NoteRevision, User
+from .deltas import apply_ops, diff_ops, normalize_newlines
+from . import activity
+
+
+def encode_payload(value):
+	return zlib.compress(json.dumps(value, separators=(',', ':'))
+				.encode('utf-8'), app.config['NOTE_COMPRESS_LEVEL'])
+
+
+def decode_payload(payload):
+	return json.loads(zlib.decompress(payload).decode('utf-8'))
+
+
+def add_revision(note_id, revision, title, text, user_id=None, base_text=None):
+	"""Stage a revision row: a snapshot, or a delta when `base_text` is given."""
+	if base_text is None:
+		snapshot, payload = True, text or ''
+	else:
+		snapshot, payload = False, diff_ops(base_text, text)
+	db.session.add(NoteRevision(note_id=note_id, revision=revision,
+				user_id=user_id, title=title, snapshot=snapshot,
+				payload=encode_payload(payload)))
+
+
+def save_note(note, title, text, user_id=None):
+	"""Set title and text of `note` and record the change in its history.
+
+	Line breaks are stored as LF. Returns False when nothing changed.
+	The caller commits; the stored revision is `note.revision + 1`, the
+	value the mapper's version counter takes on flush. A snapshot is
+	written when the last one is NOTE_SNAPSHOT_INTERVAL rows back, so
+	rebuilding any revision applies fewer deltas than that.
+	"""
+	text = normalize_newlines(text)
+	old_title, old_text = note.title, note.text
+	if title == old_title and text == old_text:
+		return False
+	interval = app.config['NOTE_SNAPSHOT_INTERVAL']
+	recent = db.session.query(NoteRevision.revision, NoteRevision.snapshot)\
+				.filter(NoteRevision.note_id == note.id)\
+				.order_by(NoteRevision.revision.desc()).limit(interval).all()
+	if not recent or recent[0].revision != note.revision:
+		# no history yet, or the note changed without it: keep the base
+		add_revision(note.id, note.revision, old_title, old_text)
+		recent = [(note.revision, True)]
+	since_snapshot = next((index for index, (_, snapshot)
+					in enumerate(recent) if snapshot), len(recent))
+	add_revision(note.id, note.revision + 1, title, text, user_id,
+				base_text=None if since_snapshot + 1 >= interval else old_text or '')
+	note.title = title
+	note.text = text
+	activity.note_edited(user_id)
+	return True
+
+
+def note_revision(note_id, revision):
+	"""(NoteRevision, text) of a stored revision, or None.
+
+	Reads the nearest snapshot at or before `revision` and replays the
+	deltas stored after it.
+	"""
+	snapshot = NoteRevision.query.filter(NoteRevision.note_id == note_id,
+					NoteRevision.snapshot == True,
+					NoteRevision.revision <= revision)\
+				.order_by(NoteRevision.revision.desc()).first()
+	if snapshot is None:
+		return None
+	deltas = NoteRevision.query.filter(NoteRevision.note_id == note_id,
+					NoteRevision.revision > snapshot.revision,
+					NoteRevision.revision <= revision)\
+				.order_by(NoteRevision.revision).all()
+	target = deltas[-1] if deltas else snapshot
+	if target.revision != revision:
+		return None
+	text = decode_payload(snapshot.payload)
+	for delta in deltas:
+		text = apply_ops(text, decode_payload(delta.payload), max_ops=None)
+	return target, text
+
+
+def revisions_query(note_id):
+	"""Newest first: revision, created, title, snapshot, username."""
+	return db.session.query(NoteRevision.revision, NoteRevision.created,
+						NoteRevision.title, NoteRevision.snapshot,
+						User.username)\
+				.outerjoin(User, User.id == NoteRevision.user_id)\
+				.filter(NoteRevision.note_id == note_id)\
+				.order_by(NoteRevision.revision.desc())
+
+
+def compact_note(note_id, keep):
+	"""Merge the deltas of all but the newest `keep` revisions of a note.
+
+	Old revisions are reduced to their snapshots; a kept delta whose
+	predecessor goes away is rewritten against the previous kept row.
+	Returns the number of rows removed.
+	"""
+	rows = NoteRevision.query.filter(NoteRevision.note_id == note_id)\
+				.order_by(NoteRevision.revision).all()
+	if len(rows) <= keep:
+		return 0
+	cutoff = rows[-keep].revision if keep else rows[-1].revision + 1
+	removed = 0
+	text = kept_text = None
+	rebase = False
+	for row in rows:
+		payload = decode_payload(row.payload)
+		text = payload if row.snapshot \
+				else apply_ops(text, payload, max_ops=None)
+		if row.revision < cutoff and not row.snapshot:
+			db.session.delete(row)
+			removed += 1
+			rebase = True
+			continue
+		if rebase and not row.snapshot:
+			row.payload = encode_payload(diff_ops(kept_text, text))
+		rebase = False
+		kept_text = text
+	return removed
+
+
+def compact_history(keep=50):
+	"""Run compact_note over every note with more than `keep` revisions."""
+	note_ids = [note_id for note_id, in db.session.query(NoteRevision.note_id)
+				.group_by(NoteRevision.note_id)
+				.having(func.count(NoteRevision.id) > keep)]
+	removed = 0
+	for note_id in note_ids:
+		removed += compact_note(note_id, keep)
+		db.session.commit()
+		db.session.expunge_all()
+	return len(note_ids), removed
+
+
+def delete_history(note_ids):
+	if note_ids:
+		db.session.query(NoteRevision)\
+			.filter(NoteRevision.note_id.in_(note_ids))\
+			.delete(synchronize_session=False)
+
+
+def forget_author(user_id):
+	db.session.query(NoteRevision)\
+		.filter(NoteRevision.user_id == user_id)\
+		.update({NoteRevision.user_id: None}, synchronize_session=False)
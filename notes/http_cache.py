@@ -0,0 +1,53 @@
+from hashlib import md5
+from flask import request, session, make_response, current_app
+
+
+def viewer_key(user):
+	# pages embed the navbar, so every logged-in user gets own validators
+	return 'user:{}'.format(user.id) if user.is_authenticated else 'anon'
+
+
+def make_etag(*parts):
+	return md5('|'.join(map(str, parts)).encode()).hexdigest()
+
+
+def has_pending_flashes():
+	return bool(session.get('_flashes'))
+
+
+def is_not_modified(etag, last_modified):
+	if request.if_none_match:
+		return request.if_none_match.contains(etag)
+	if request.if_modified_since and last_modified:
+		return last_modified.replace(microsecond=0) <= request.if_modified_since
+	return False
+
+
+def set_validators(response, etag, last_modified, public=False):
+	response.set_etag(etag)
+	if last_modified:
+		response.last_modified = last_modified
+	if public:
+		response.cache_control.public = True
+		response.cache_control.max_age = current_app.config['HTTP_CACHE_MAX_AGE']
+	else:
+		response.cache_control.private = True
+		response.cache_control.no_cache = True
+	response.vary.add('Cookie')
+	return response
+
+
+def conditional_response(etag, last_modified, render, public=False):
+	"""304 when the client's validators still match, else `render()`.
+
+	`render` is only called on a miss, so a revalidation costs nothing but
+	the metadata query that produced `etag` and `last_modified`. Pages with
+	pending flash messages are always rendered and never cached.
+	"""
+	if has_pending_flashes():
+		return make_response(render())
+	if is_not_modified(etag, last_modified):
+		response = current_app.response_class(status=304)
+	else:
+		response = make_response(render())
+	return set_validators(response, etag, last_modified, public)
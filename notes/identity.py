@@ -0,0 +1,59 @@
+from notes import app, db
+from .cache import LRUCache
+from .models import User
+
+
+class Principal:
+	"""Lightweight logged-in identity for flask_login's `current_user`.
+
+	Holds only what templates and permission checks read. Routes that
+	modify the account load the ORM `User` explicitly.
+	"""
+	__slots__ = ('id', 'username', 'email')
+
+	is_authenticated = True
+	is_active = True
+	is_anonymous = False
+
+	def __init__(self, id, username, email=None):
+		self.id = id
+		self.username = username
+		self.email = email
+
+	def get_id(self):
+		return str(self.id)
+
+	def __eq__(self, other):
+		if hasattr(other, 'get_id'):
+			return self.get_id() == other.get_id()
+		return NotImplemented
+
+	def __ne__(self, other):
+		equal = self.__eq__(other)
+		return equal if equal is NotImplemented else not equal
+
+	def __hash__(self):
+		return hash(self.id)
+
+	def __repr__(self):
+		return '{}th principal {}'.format(self.id, self.username)
+
+
+identity_cache = LRUCache(app.config['IDENTITY_CACHE_SIZE'],
+						app.config['IDENTITY_CACHE_TTL'])
+
+
+def load_principal(user_id):
+	principal = identity_cache.get(user_id)
+	if principal is None:
+		row = db.session.query(User.id, User.username, User.email)\
+					.filter(User.id == user_id).first()
+		if row is None:
+			return None
+		principal = Principal(*row)
+		identity_cache.set(user_id, principal)
+	return principal
+
+
+def forget_principal(user_id):
+	identity_cache.delete(user_id)
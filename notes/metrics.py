@@ -0,0 +1,289 @@
+import logging
+import re
+import threading
+from time import perf_counter
+from flask import g, request, has_app_context, has_request_context
+from flask.signals import (
+	signals_available, before_render_template, template_rendered
+)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from notes import app, db
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 500)
+
+slow_log = logging.getLogger('notes.slow')
+
+
+class Histogram:
+	"""Cumulative-bucket histogram per label set, Prometheus style."""
+	def __init__(self, name, help, labels, buckets=LATENCY_BUCKETS):
+		self.name = name
+		self.help = help
+		self.labels = labels
+		self.buckets = buckets
+		self._series = {}
+		self._lock = threading.Lock()
+
+	def observe(self, value, *label_values):
+		with self._lock:
+			series = self._series.get(label_values)
+			if series is None:
+				series = self._series[label_values] = \
+					[[0] * len(self.buckets), 0.0, 0]
+			counts = series[0]
+			for index, bound in enumerate(self.buckets):
+				if value <= bound:
+					counts[index] += 1
+			series[1] += value
+			series[2] += 1
+
+	def expose(self):
+		lines = ['# HELP {} {}'.format(self.name, self.help),
+				'# TYPE {} histogram'.format(self.name)]
+		with self._lock:
+			items = [(key, list(counts), total, count)
+					for key, (counts, total, count) in self._series.items()]
+		for label_values, counts, total, count in sorted(items):
+			labels = format_labels(self.labels, label_values)
+			for bound, bucket_count in zip(self.buckets, counts):
+				lines.append('{}_bucket{} {}'.format(self.name,
+					format_labels(self.labels + ('le',),
+						label_values + (repr(float(bound)),)), bucket_count))
+			lines.append('{}_bucket{} {}'.format(self.name,
+				format_labels(self.labels + ('le',), label_values + ('+Inf',)),
+				count))
+			lines.append('{}_sum{} {}'.format(self.name, labels, total))
+			lines.append('{}_count{} {}'.format(self.name, labels, count))
+		return lines
+
+
+class Counter:
+	def __init__(self, name, help, labels=()):
+		self.name = name
+		self.help = help
+		self.labels = labels
+		self._values = {}
+		self._lock = threading.Lock()
+
+	def inc(self, amount=1, *label_values):
+		with self._lock:
+			self._values[label_values] = self._values.get(label_values, 0) + amount
+
+	def expose(self):
+		lines = ['# HELP {} {}'.format(self.name, self.help),
+				'# TYPE {} counter'.format(self.name)]
+		with self._lock:
+			items = sorted(self._values.items())
+		for label_values, value in items:
+			lines.append('{}{} {}'.format(self.name,
+				format_labels(self.labels, label_values), value))
+		return lines
+
+
+class Gauge:
+	"""Value read from `read()` at scrape time: [(label_values, value)].
+
+	`kind='counter'` exposes a monotonic value kept elsewhere as a counter.
+	"""
+	def __init__(self, name, help, labels, read, kind='gauge'):
+		self.name = name
+		self.help = help
+		self.labels = labels
+		self.read = read
+		self.kind = kind
+
+	def expose(self):
+		lines = ['# HELP {} {}'.format(self.name, self.help),
+				'# TYPE {} {}'.format(self.name, self.kind)]
+		for label_values, value in self.read():
+			lines.append('{}{} {}'.format(self.name,
+				format_labels(self.labels, label_values), value))
+		return lines
+
+
+def format_labels(names, values):
+	if not names:
+		return ''
+	return '{' + ','.join('{}="{}"'.format(name, str(value)
+				.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+			for name, value in zip(names, values)) + '}'
+
+
+SQL_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+SQL_PLACEHOLDER_LISTS = re.compile(r'\((?:\s*(?:\?|%s|%\(\w+\)s)\s*,)+\s*(?:\?|%s|%\(\w+\)s)\s*\)')
+SQL_WHITESPACE = re.compile(r'\s+')
+
+
+def normalize_sql(statement):
+	"""Statement shape for logs: literals and IN-lists collapsed to `?`."""
+	statement = SQL_LITERALS.sub('?', statement)
+	statement = SQL_PLACEHOLDER_LISTS.sub('(?)', statement)
+	return SQL_WHITESPACE.sub(' ', statement).strip()
+
+
+_pool_providers = []
+
+
+def pool_status():
+	for label, pool in _pool_providers:
+		for name in ('size', 'checkedout', 'overflow', 'checkedin'):
+			method = getattr(pool, name, None)
+			if method is not None:
+				yield (label, name), method()
+
+
+def cache_status():
+	from .cache import response_cache
+	return [(('hits',), response_cache.hits),
+			(('misses',), response_cache.misses)]
+
+
+request_latency = Histogram('notes_request_duration_seconds',
+	'Request latency by endpoint.', ('endpoint', 'method', 'status'))
+request_sql = Histogram('notes_request_sql_statements',
+	'SQL statements issued per request.', ('endpoint',), COUNT_BUCKETS)
+sql_statements = Counter('notes_sql_statements_total',
+	'SQL statements executed.', ('endpoint',))
+sql_seconds = Counter('notes_sql_seconds_total',
+	'Time spent executing SQL statements.', ('endpoint',))
+pool_wait = Histogram('notes_db_pool_checkout_wait_seconds',
+	'Time spent waiting for a pooled connection.', ('engine',))
+template_render = Histogram('notes_template_render_seconds',
+	'Jinja render time by template.', ('template',))
+pool_gauge = Gauge('notes_db_pool_connections',
+	'Connection pool state.', ('engine', 'state'), pool_status)
+cache_gauge = Gauge('notes_response_cache_lookups_total',
+	'Response cache hits and misses.', ('result',), cache_status, 'counter')
+
+METRICS = [request_latency, request_sql, sql_statements, sql_seconds,
+		pool_wait, template_render, pool_gauge, cache_gauge]
+
+
+def register(metric):
+	METRICS.append(metric)
+	return metric
+
+
+def current_endpoint():
+	if has_request_context():
+		return request.endpoint or 'unknown'
+	return 'background'
+
+
+def expose():
+	lines = []
+	for metric in METRICS:
+		lines.extend(metric.expose())
+	return '\n'.join(lines) + '\n'
+
+
+# The start time lives on the execution context, which ends with its
+# statement, so one that fails leaves nothing behind on the pooled
+# connection. Statements without a context (the dialect's first-connect
+# checks) are not counted.
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def before_cursor_execute(conn, cursor, statement, parameters, context,
+						executemany):
+	if context is not None:
+		context._query_started = perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def after_cursor_execute(conn, cursor, statement, parameters, context,
+						executemany):
+	started = getattr(context, '_query_started', None)
+	if started is None:
+		return
+	elapsed = perf_counter() - started
+	endpoint = current_endpoint()
+	sql_statements.inc(1, endpoint)
+	sql_seconds.inc(elapsed, endpoint)
+	if has_app_context():
+		g.sql_statements = g.get('sql_statements', 0) + 1
+	if elapsed * 1000 >= app.config['METRICS_SLOW_QUERY_MS']:
+		slow_log.warning('slow query %.1fms endpoint=%s sql=%s',
+			elapsed * 1000, endpoint, normalize_sql(statement))
+
+
+def instrument_pool(engine, label='default'):
+	"""Time `pool.connect()` and report the pool's size on /metrics."""
+	pool = engine.pool
+	if getattr(pool, '_notes_instrumented', False):
+		return
+	connect = pool.connect
+
+	def timed_connect():
+		started = perf_counter()
+		try:
+			return connect()
+		finally:
+			pool_wait.observe(perf_counter() - started, label)
+
+	pool.connect = timed_connect
+	pool._notes_instrumented = True
+	_pool_providers.append((label, pool))
+
+
+@app.before_first_request
+def instrument_default_pool():
+	instrument_pool(db.engine)
+	for bind in db.replica_binds():
+		instrument_pool(db.get_engine(bind=bind), bind)
+
+
+@app.before_request
+def start_request_timer():
+	g.request_started = perf_counter()
+	g.sql_statements = 0
+
+
+@app.after_request
+def record_request(response):
+	started = g.pop('request_started', None)
+	if started is None:
+		return response
+	endpoint = request.endpoint or 'unknown'
+	method, path, status = request.method, request.path, response.status_code
+	# a streamed body (notes/streaming.py) runs its queries and templates
+	# while it is sent and may outlive the request context, so its
+	# statements are read from this request's g once the last chunk is out
+	state = g._get_current_object()
+
+	def record():
+		elapsed = perf_counter() - started
+		statements = state.get('sql_statements', 0)
+		request_latency.observe(elapsed, endpoint, method, status)
+		request_sql.observe(statements, endpoint)
+		if elapsed * 1000 >= app.config['METRICS_SLOW_REQUEST_MS']:
+			slow_log.warning('slow request %.1fms endpoint=%s sql=%d path=%s',
+				elapsed * 1000, endpoint, statements, path)
+
+	if response.is_streamed:
+		response.call_on_close(record)
+	else:
+		record()
+	return response
+
+
+if signals_available:
+	def start_template_timer(sender, template, context, **extra):
+		g.template_started = perf_counter()
+
+	def record_template(sender, template, context, **extra):
+		started = g.pop('template_started', None)
+		if started is not None:
+			template_render.observe(perf_counter() - started,
+									template.name or 'string')
+
+	before_render_template.connect(start_template_timer, app)
+	template_rendered.connect(record_template, app)
+
+
+@app.route('/metrics')
+def metrics():
+	return app.response_class(expose(),
+			mimetype='text/plain; version=0.0.4')
@@ -1,6 +1,7 @@
 from notes import db
 from sqlalchemy.ext.hybrid import hybrid_property
-from werkzeug.security import generate_password_hash, check_password_hash
+from notes.hashing import password_hasher
+from notes.compression import pack_text, unpack_text
 from flask_login import UserMixin
 from datetime import datetime
 
@@ -13,10 +14,33 @@ class TimestampMixin:
 
 class Note(TimestampMixin, db.Model):
 	__tablename__ = 'note'
+	__table_args__ = (
+		db.Index('ix_note_updated_id', 'updated', 'id'),
+	)
 	id = db.Column(db.Integer, primary_key=True)
 	url_id = db.Column(db.String(9), unique=True, nullable=False)
 	title = db.Column(db.String(100))
-	text = db.Column(db.Text)
+	# the body is only loaded where it is rendered, see undefer_group('body');
+	# long bodies live zlib compressed in text_z with text left NULL
+	_text = db.deferred(db.Column('text', db.Text), group='body')
+	text_z = db.deferred(db.Column(db.LargeBinary), group='body')
+	# bumped on every update; a stale UPDATE raises StaleDataError
+	revision = db.Column(db.Integer, nullable=False, default=0,
+						server_default='0')
+	__mapper_args__ = {'version_id_col': revision}
+
+	@hybrid_property
+	def text(self):
+		return unpack_text(self._text, self.text_z)
+
+	@text.setter
+	def text(self, text):
+		self._text, self.text_z = pack_text(text)
+
+	@text.expression
+	def text(cls):
+		# SQL sees the plain column only; compressed bodies read as NULL
+		return cls._text
 
 	def __repr__(self):
 		return '{}th note {}'.format(self.id, self.url_id)
@@ -35,10 +59,13 @@ class User(UserMixin, db.Model):
 
 	@password_hash.setter
 	def password(self, password):
-		self._password_hash = generate_password_hash(password)
+		self._password_hash = password_hasher.hash(password)
 
 	def check_password(self, password):
-		return check_password_hash(self._password_hash, password)
+		return password_hasher.verify(self._password_hash, password)
+
+	def password_needs_rehash(self):
+		return password_hasher.needs_rehash(self._password_hash)
 
 	def __repr__(self):
 		return '{}th user {}'.format(self.id, self.username)
@@ -46,6 +73,11 @@ class User(UserMixin, db.Model):
 
 class UserNoteParams(db.Model):
 	__tablename__ = 'user_note_params'
+	__table_args__ = (
+		db.Index('ix_user_note_params_note_id', 'note_id', unique=True),
+		db.Index('ix_user_note_params_user_id_private_access',
+				'user_id', 'private_access'),
+	)
 	id = db.Column(db.Integer, primary_key=True)
 	note_id = db.Column(db.Integer, db.ForeignKey('note.id'))
 	user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -60,11 +92,85 @@ class UserNoteParams(db.Model):
 
 class PrivateAccess(db.Model):
 	__tablename__ = 'private_access'
+	__table_args__ = (
+		db.Index('ix_private_access_user_id_note_id',
+				'user_id', 'note_id', unique=True),
+		db.Index('ix_private_access_note_id', 'note_id'),
+		# "shared with me", newest grant first
+		db.Index('ix_private_access_user_id_id', 'user_id', 'id'),
+	)
 	id = db.Column(db.Integer, primary_key=True)
 	note_id = db.Column(db.Integer, db.ForeignKey('note.id'))
+	# the user the note is shared with
 	user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
 	# many to one
 	user = db.relationship('User', backref='private_accesses')
-	# one to one
-	note = db.relationship('Note', backref=db.backref('private_access'), uselist=False)
+	# many to one: a note can be shared with many users
+	note = db.relationship('Note', backref='private_accesses')
+
+
+class NoteRevision(db.Model):
+	__tablename__ = 'note_revision'
+	__table_args__ = (
+		db.Index('ix_note_revision_note_id_revision',
+				'note_id', 'revision', unique=True),
+	)
+	id = db.Column(db.Integer, primary_key=True)
+	note_id = db.Column(db.Integer, db.ForeignKey('note.id'), nullable=False)
+	# Note.revision this row reproduces
+	revision = db.Column(db.Integer, nullable=False)
+	user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+	created = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+	title = db.Column(db.String(100))
+	# zlib compressed JSON: the whole text for snapshots, otherwise the ops
+	# from the previous stored revision of the note
+	snapshot = db.Column(db.Boolean, nullable=False, default=False)
+	payload = db.Column(db.LargeBinary, nullable=False)
+	# many to one
+	user = db.relationship('User')
+
+
+class NoteSearchToken(db.Model):
+	__tablename__ = 'note_search_token'
+	# inverted index: one row per (term, note), weight = ranked term frequency
+	term = db.Column(db.String(40), primary_key=True)
+	note_id = db.Column(db.Integer, db.ForeignKey('note.id'),
+						primary_key=True, index=True)
+	weight = db.Column(db.Integer, nullable=False, default=1)
+	# the term is in the title; only those match encrypted notes of others
+	in_title = db.Column(db.Boolean, nullable=False, default=False)
 
+
+class NoteCounter(db.Model):
+	__tablename__ = 'note_counter'
+	name = db.Column(db.String(30), primary_key=True)
+	value = db.Column(db.Integer, nullable=False, default=0)
+
+
+class UserNoteStats(db.Model):
+	__tablename__ = 'user_note_stats'
+	user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+	notes_count = db.Column(db.Integer, nullable=False, default=0, index=True)
+	public_notes_count = db.Column(db.Integer, nullable=False, default=0)
+	# one to one
+	user = db.relationship('User', backref=db.backref('note_stats', uselist=False))
+
+
+class NoteActivity(db.Model):
+	__tablename__ = 'note_activity'
+	# notes created and edited per hour and per day, see notes/activity.py
+	period = db.Column(db.String(4), primary_key=True)
+	bucket = db.Column(db.DateTime, primary_key=True)
+	anonymous_notes = db.Column(db.Integer, nullable=False, default=0)
+	public_notes = db.Column(db.Integer, nullable=False, default=0)
+	private_notes = db.Column(db.Integer, nullable=False, default=0)
+	edits = db.Column(db.Integer, nullable=False, default=0)
+
+
+class AuthorActivity(db.Model):
+	__tablename__ = 'author_activity'
+	# one row per user who wrote a note in a day or week
+	period = db.Column(db.String(4), primary_key=True)
+	bucket = db.Column(db.DateTime, primary_key=True)
+	user_id = db.Column(db.Integer, db.ForeignKey('user.id'), primary_key=True)
+	writes = db.Column(db.Integer, nullable=False, default=0)
@@ -0,0 +1,165 @@
+from base64 import urlsafe_b64encode, urlsafe_b64decode
+from datetime import datetime
+from sqlalchemy import or_
+
+
+CURSOR_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%f'
+
+
+class Page:
+	def __init__(self, items, next_cursor=None, prev_cursor=None):
+		self.items = items
+		self.next_cursor = next_cursor
+		self.prev_cursor = prev_cursor
+
+	def __iter__(self):
+		return iter(self.items)
+
+	def __len__(self):
+		return len(self.items)
+
+
+def encode_cursor(updated, row_id):
+	raw = '{}|{}'.format(updated.strftime(CURSOR_TIME_FORMAT), row_id)
+	return urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+	# opaque token -> (updated, id); None for anything malformed
+	if not cursor:
+		return None
+	try:
+		padded = cursor + '=' * (-len(cursor) % 4)
+		updated, row_id = urlsafe_b64decode(padded.encode()).decode().split('|')
+		return datetime.strptime(updated, CURSOR_TIME_FORMAT), int(row_id)
+	except (ValueError, UnicodeDecodeError):
+		return None
+
+
+def keyset_query(query, updated_col, id_col, after=None, before=None,
+				limit=50):
+	"""`query` seeked to the page after/before the decoded cursors.
+
+	The seek is written as `updated <= u AND (updated < u OR id < i)`
+	rather than a bare OR, so the leading range condition lets the database
+	start reading the (updated, id) index at the cursor: every page costs
+	the same as the first.
+	Rows come back newest first, except when paging `before`, where they
+	are oldest first and have to be reversed by the caller.
+	"""
+	if before:
+		updated, row_id = before
+		return query.filter(updated_col >= updated,
+							or_(updated_col > updated, id_col > row_id))\
+					.order_by(updated_col.asc(), id_col.asc()).limit(limit)
+	if after:
+		updated, row_id = after
+		query = query.filter(updated_col <= updated,
+							or_(updated_col < updated, id_col < row_id))
+	return query.order_by(updated_col.desc(), id_col.desc()).limit(limit)
+
+
+def keyset_page(query, updated_col, id_col, after=None, before=None,
+				per_page=50):
+	"""Newest-first page of `query` ordered by (updated_col, id_col).
+
+	`after` continues to older rows, `before` goes back to newer ones.
+	Rows must expose `updated` and `id` attributes matching the two columns.
+	"""
+	after, before = decode_cursor(after), decode_cursor(before)
+	rows = keyset_query(query, updated_col, id_col, after, before,
+					per_page + 1).all()
+	has_more = len(rows) > per_page
+	rows = rows[:per_page]
+	if before:
+		rows.reverse()
+
+	next_cursor = prev_cursor = None
+	if rows:
+		first, last = rows[0], rows[-1]
+		if before:
+			has_next, has_prev = True, has_more
+		else:
+			has_next, has_prev = has_more, bool(after)
+		if has_next:
+			next_cursor = encode_cursor(last.updated, last.id)
+		if has_prev:
+			prev_cursor = encode_cursor(first.updated, first.id)
+	return Page(rows, next_cursor, prev_cursor)
+
+
+class StreamedPage(Page):
+	"""Newest-first page whose rows are fetched while it is iterated.
+
+	It can be iterated once. `next_cursor` and `prev_cursor` are only known
+	after the last row has gone by, so templates read them after the loop.
+	"""
+	def __init__(self, query, per_page, after=None):
+		Page.__init__(self, None)
+		self.query = query
+		self.per_page = per_page
+		self.after = after
+
+	def __iter__(self):
+		first = last = None
+		count = 0
+		# the query asks for one row more than the page to learn has_more
+		for row in self.query:
+			if count == self.per_page:
+				self.next_cursor = encode_cursor(last.updated, last.id)
+				continue
+			if first is None:
+				first = row
+				if self.after:
+					self.prev_cursor = encode_cursor(row.updated, row.id)
+			last = row
+			count += 1
+			yield row
+
+	def __len__(self):
+		raise TypeError('a streamed page has no length before it is read')
+
+
+def keyset_stream(query, updated_col, id_col, after=None, before=None,
+				per_page=50, batch_size=100):
+	"""`keyset_page` fetching `batch_size` rows at a time while iterated.
+
+	Pages going back `before` a cursor come oldest first and have to be
+	reversed, so they are read in full like `keyset_page` does.
+	"""
+	if decode_cursor(before):
+		return keyset_page(query, updated_col, id_col, after, before, per_page)
+	after = decode_cursor(after)
+	return StreamedPage(keyset_query(query, updated_col, id_col, after, None,
+						per_page + 1).yield_per(batch_size), per_page, after)
+
+
+def id_page(query, id_col, after=None, before=None, per_page=50):
+	"""Newest-first page of `query` ordered by the unique `id_col` alone.
+
+	Cursors are the plain integer ids of the last and first rows, which
+	must expose `id`.
+	"""
+	if before is not None:
+		rows = query.filter(id_col > before).order_by(id_col.asc())\
+					.limit(per_page + 1).all()
+	else:
+		if after is not None:
+			query = query.filter(id_col < after)
+		rows = query.order_by(id_col.desc()).limit(per_page + 1).all()
+	has_more = len(rows) > per_page
+	rows = rows[:per_page]
+	if before is not None:
+		rows.reverse()
+
+	next_cursor = prev_cursor = None
+	if rows:
+		if before is not None:
+			has_next, has_prev = True, has_more
+		else:
+			has_next, has_prev = has_more, after is not None
+		if has_next:
+			next_cursor = rows[-1].id
+		if has_prev:
+			prev_cursor = rows[0].id
+	return Page(rows, next_cursor, prev_cursor)
@@ -0,0 +1,69 @@
+from sqlalchemy import and_, or_
+from notes import db
+from .models import User, Note, UserNoteParams, PrivateAccess
+
+
+# Query shapes shared by the listing routes and `manage.py explain_queries`.
+
+def public_notes_query(*columns, with_author=False):
+	query = db.session.query(*columns)\
+				.join(UserNoteParams,
+				UserNoteParams.note_id == Note.id, isouter=True)
+	if with_author:
+		query = query.join(User,
+				User.id == UserNoteParams.user_id, isouter=True)
+	return query.filter(or_(UserNoteParams.id == None,
+							UserNoteParams.private_access == False))
+
+
+def feed_query():
+	return public_notes_query(Note.id, Note.title, Note.url_id,
+				Note.updated, User.username, with_author=True)
+
+
+def feed_probe_query():
+	# the author is shown on the feed, so a rename has to change its ETag
+	return public_notes_query(Note.id, Note.updated, User.username,
+				with_author=True)
+
+
+def user_notes_query(user_id, include_private=False, viewer_id=None):
+	"""Notes of `user_id`: every one with `include_private`, otherwise the
+	public ones and the private ones shared with `viewer_id`."""
+	return filter_user_notes(
+				db.session.query(Note.id, Note.title, Note.url_id, Note.updated),
+				user_id, include_private, viewer_id)
+
+
+def filter_user_notes(query, user_id, include_private=False, viewer_id=None):
+	"""`query` over Note narrowed to the notes `user_notes_query` returns."""
+	query = query.join(UserNoteParams, UserNoteParams.note_id == Note.id)\
+				.filter(UserNoteParams.user_id == user_id)
+	if include_private:
+		return query
+	if viewer_id is None:
+		return query.filter(UserNoteParams.private_access == False)
+	# one probe of the (user_id, note_id) grant index per note
+	return query.join(PrivateAccess,
+					and_(PrivateAccess.note_id == Note.id,
+						PrivateAccess.user_id == viewer_id), isouter=True)\
+				.filter(or_(UserNoteParams.private_access == False,
+							PrivateAccess.id != None))
+
+
+def shared_notes_query(viewer_id):
+	"""Notes shared with `viewer_id`, one row per grant with its id."""
+	return db.session.query(PrivateAccess.id, Note.title, Note.url_id,
+						Note.updated, User.username)\
+				.join(Note, Note.id == PrivateAccess.note_id)\
+				.join(UserNoteParams, UserNoteParams.note_id == Note.id)\
+				.join(User, User.id == UserNoteParams.user_id)\
+				.filter(PrivateAccess.user_id == viewer_id)
+
+
+def note_grants_query(note_id):
+	"""(user id, username) of everyone `note_id` is shared with."""
+	return db.session.query(User.id, User.username)\
+				.join(PrivateAccess, PrivateAccess.user_id == User.id)\
+				.filter(PrivateAccess.note_id == note_id)\
+				.order_by(User.username)
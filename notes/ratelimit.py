@@ -0,0 +1,53 @@
+import threading
+from collections import OrderedDict
+from math import ceil
+from time import monotonic
+
+
+class RateLimited(Exception):
+	"""The client spent its tokens; `retry_after` seconds until the next."""
+	def __init__(self, retry_after):
+		Exception.__init__(self, retry_after)
+		self.retry_after = retry_after
+
+
+class TokenBucket:
+	"""In-process token buckets, one per key (user or client address).
+
+	Each bucket holds up to `burst` tokens and refills at `rate` tokens per
+	second. Only the `max_keys` most recently used buckets are kept; a
+	forgotten one comes back full. Limits are per process, so with N web
+	workers a client gets up to N times the configured rate.
+	"""
+	def __init__(self, rate, burst, max_keys=10000):
+		self.rate = rate
+		self.burst = burst
+		self.max_keys = max_keys
+		self._buckets = OrderedDict()
+		self._lock = threading.Lock()
+
+	def take(self, key, tokens=1):
+		"""Spend `tokens` from the bucket of `key` or raise RateLimited."""
+		now = monotonic()
+		with self._lock:
+			available, updated = self._buckets.pop(key, (self.burst, now))
+			available = min(self.burst, available + (now - updated) * self.rate)
+			if available >= tokens:
+				available -= tokens
+				retry_after = None
+			else:
+				retry_after = (tokens - available) / self.rate \
+					if self.rate else float('inf')
+			self._buckets[key] = (available, now)
+			while len(self._buckets) > self.max_keys:
+				self._buckets.popitem(last=False)
+		if retry_after is not None:
+			raise RateLimited(retry_after)
+
+	def reset(self):
+		with self._lock:
+			self._buckets.clear()
+
+
+def retry_after_header(seconds):
+	return str(max(1, int(ceil(min(seconds, 3600)))))
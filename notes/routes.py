@@ -1,23 +1,48 @@
 from flask import (
-	render_template, redirect, request, url_for, flash, jsonify
+	render_template, redirect, request, url_for, flash, jsonify,
+	stream_with_context
 )
+from flask_wtf.csrf import validate_csrf
+from wtforms import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
 from flask_login import (
 	LoginManager,
 	current_user, login_user, logout_user, login_required
 )
 from notes import app, db
-from sqlalchemy import or_, func
-from .models import User, Note, UserNoteParams, PrivateAccess
+from .models import User, Note, UserNoteParams, PrivateAccess, NoteRevision
+from .pagination import keyset_page, keyset_stream, id_page
+from .queries import (
+	feed_query, feed_probe_query, user_notes_query, shared_notes_query,
+	note_grants_query
+)
+from .search import SearchResults, index_note
+from . import stats, bulk, transfer
+from .access import resolve_note_access, viewer_id_of
+from .http_cache import make_etag, viewer_key, conditional_response
+from .cache import response_cache
+from .identity import load_principal, forget_principal
+from .usernames import username_index
+from .hashing import HashingBusy
+from .ratelimit import TokenBucket, RateLimited, retry_after_header
+from .drafts import draft_token, is_draft_of
+from .routing import replica_reads
+from .streaming import stream_template, streaming_enabled
+from .deltas import apply_ops, normalize_newlines, DeltaError
+from .history import save_note, note_revision, revisions_query
 from .forms import (
 		NoteForm,
 		UserForm,
 		UserNoteParamsForm,
 		RegisterForm,
 		LoginForm,
-		SearchForm
+		SearchForm,
+		RestoreForm,
+		ImportForm,
+		ShareForm,
+		RevokeForm
 	)
-from secrets import choice as sec_choice
-from string import digits, ascii_letters
 from urllib.parse import quote, unquote
 from functools import wraps
 
@@ -28,7 +53,51 @@ login_manager.login_view = 'login'
 
 @login_manager.user_loader
 def load_user(user_id):
-	return User.query.get(int(user_id))
+	return load_principal(int(user_id))
+
+
+@app.errorhandler(HashingBusy)
+def hashing_busy(error):
+	response = jsonify('429: Too Many Requests')
+	response.status_code = 429
+	response.headers['Retry-After'] = '1'
+	return response
+
+
+@app.errorhandler(RateLimited)
+def rate_limited(error):
+	response = jsonify('429: Too Many Requests')
+	response.status_code = 429
+	response.headers['Retry-After'] = retry_after_header(error.retry_after)
+	return response
+
+
+create_limiter = TokenBucket(app.config['NOTE_CREATE_RATE'],
+					app.config['NOTE_CREATE_BURST'],
+					app.config['RATE_LIMIT_MAX_KEYS'])
+bulk_create_limiter = TokenBucket(app.config['NOTE_BULK_CREATE_RATE'],
+					app.config['NOTE_BULK_CREATE_BURST'],
+					app.config['RATE_LIMIT_MAX_KEYS'])
+
+
+def rate_limit_key():
+	# the current user or, when anonymous, the client address
+	viewer_id = viewer_id_of(current_user)
+	return ('user', viewer_id) if viewer_id is not None \
+		else ('addr', request.remote_addr)
+
+
+def take_create_token():
+	"""Spend the token of one note about to be created; raises RateLimited."""
+	if app.config['NOTE_CREATE_BURST']:
+		create_limiter.take(rate_limit_key())
+
+
+def take_bulk_create_token():
+	"""Spend the token of one batch of notes, from the API or an import;
+	raises RateLimited."""
+	if app.config['NOTE_BULK_CREATE_BURST']:
+		bulk_create_limiter.take(rate_limit_key())
 
 
 # decorator for route percent-encoding
@@ -80,171 +149,389 @@ def db_session_delete(del_elem, succ_msg='', err_msg='Some error...'):
 
 @app.route("/chart")
 def chart():
-	pie_legend = 'Notes Type'
-	pie_labels = ['anonymous notes', 'user notes']
+	# the charts load their data from /api/v1/stats/notes and /activity
+	return render_template('chart.html')
 
-	anon_notes_count = db.session.query(Note).join(UserNoteParams, 
-					UserNoteParams.note_id == Note.id, isouter=True)\
-					.filter(UserNoteParams.id == None).count()
-	user_notes_count = db.session.query(UserNoteParams.id).count()
-	pie_values = [anon_notes_count, user_notes_count]
 
+@app.route('/')
+@replica_reads
+def index():
+	after, before = request.args.get('after'), request.args.get('before')
+	return response_cache.serve(response_cache.feed_key(after, before),
+			lambda: render_index(after, before))
 
-	line_legend = 'User Notes'
 
-	users = db.session.query(func.count(UserNoteParams.user_id))\
-								.join(User,
-									User.id == UserNoteParams.user_id, isouter=True)\
-								.add_columns(User.username)\
-								.group_by(User.username)
+def render_index(after, before):
+	per_page = app.config['NOTES_PER_PAGE']
 
-	line_labels = []
-	line_values = []
-	for user in users:
-		line_labels.append(user[1])
-		line_values.append(user[0])
+	# cheap id/updated/author probe of the same page to validate client caches
+	probe = keyset_page(feed_probe_query(),
+				Note.updated, Note.id, after, before, per_page)
+	etag = make_etag(viewer_key(current_user), probe.next_cursor,
+				probe.prev_cursor,
+				*((note.id, note.updated, note.username) for note in probe))
+	last_modified = max((note.updated for note in probe), default=None)
 
-	return render_template('chart.html',
-			pie_values=pie_values, pie_labels=pie_labels, pie_legend=pie_legend,
-			line_values=line_values, line_labels=line_labels, line_legend=line_legend)
+	def render():
+		page = listing_page(feed_query(), after, before, per_page)
+		return stream_template('index.html', notes=page)
 
+	return conditional_response(etag, last_modified, render)
 
-@app.route('/')
-def index():
-	notes = db.session.query(Note).join(UserNoteParams, 
-					UserNoteParams.note_id == Note.id, isouter=True)\
-					.join(User, 
-					User.id == UserNoteParams.user_id, isouter=True)\
-					.add_columns(Note.id, Note.title, Note.url_id,
-						Note.updated, User.username)\
-					.filter(or_(UserNoteParams.id == None,
-								UserNoteParams.private_access == False))\
-					.order_by(Note.updated.desc())
-	
-	return render_template('index.html', notes=notes)
-
-
-@app.route('/search', methods=['GET','POST'])
+
+def listing_page(query, after, before, per_page):
+	# streamed pages fetch their rows while the template iterates them
+	if streaming_enabled():
+		return keyset_stream(query, Note.updated, Note.id, after, before,
+					per_page, app.config['STREAM_BATCH_SIZE'])
+	return keyset_page(query, Note.updated, Note.id, after, before, per_page)
+
+
+@app.route('/search')
+@replica_reads
 def search():
-	form = SearchForm()
-	if request.method == 'POST' and form.submit.data:
-		search = "%{}%".format(form.search_query.data)
-		notes = db.session.query(Note).join(UserNoteParams, 
-						UserNoteParams.note_id == Note.id, isouter=True)\
-						.join(User, 
-						User.id == UserNoteParams.user_id, isouter=True)\
-						.add_columns(Note.id, Note.title, Note.url_id,
-							Note.text, Note.updated, User.username)\
-						.filter(or_(User.username.like(search),
-									Note.title.like(search),
-									Note.text.like(search)))\
-						.order_by(Note.updated.desc())
-
-		return render_template('search.html', form=form, notes=notes)
-	return render_template('search.html', form=form)
-
-
-def generate_url_id():
-	alphabet = digits + ascii_letters.upper() + digits + ascii_letters
-	url_id = ''.join(sec_choice(alphabet) for i in range(9))
-	return url_id
+	form = SearchForm(request.args, meta={'csrf': False})
+	if not (form.search_query.data and form.validate()):
+		return render_template('search.html', form=form)
+
+	query = form.search_query.data
+	page = request.args.get('page', 1, type=int) or 1
+	if form.mode.data == 'authors':
+		# served from the in-memory index, no note table is read
+		per_page = app.config['SEARCH_AUTHORS_PER_PAGE']
+		authors = username_index.prefix(query, per_page + 1,
+						(page - 1) * per_page)
+		return render_template('search.html', form=form, mode='authors',
+				authors=authors[:per_page], query=query, page=page,
+				has_more=len(authors) > per_page)
+
+	per_page = app.config['SEARCH_RESULTS_PER_PAGE']
+	viewer_id = current_user.id if current_user.is_authenticated else None
+	results = SearchResults(query, viewer_id, page, per_page,
+				app.config['SEARCH_SNIPPET_LENGTH'],
+				app.config['STREAM_BATCH_SIZE'] if streaming_enabled() else None)
+
+	authors = username_index.prefix(query, app.config['USERNAME_SUGGEST_LIMIT'])
+
+	return stream_template('search.html', form=form, mode='notes',
+			results=results, authors=authors, query=query, page=page)
 
 
 @app.route('/create')
 def note_create():
-	new_url_id = generate_url_id()
-	new_note = Note(url_id=new_url_id)
-	db_session_add(new_note)
-	flash('{}th note'.format(new_note.id))
+	# nothing is written here: the url_id is only reserved in a signed
+	# draft token until the first save in note_edit
+	take_create_token()
+	viewer_id = viewer_id_of(current_user)
+	new_url_id = bulk.generate_url_id()
+	return redirect(url_for('note_edit', url_id=new_url_id,
+					draft=draft_token(new_url_id, viewer_id)))
 
+
+def note_draft_edit(url_id):
+	note_form = NoteForm(formdata=request.form)
+	params_form = None
 	if current_user.is_authenticated:
-		params = UserNoteParams(note_id=new_note.id, user_id=current_user.id,)
-		db_session_add(params)	
+		params_form = UserNoteParamsForm(formdata=request.form)
+		if request.method != 'POST':
+			params_form.private_access.data = True
+	if request.method == 'POST' and note_form.validate_on_submit():
+		params = None
+		if params_form:
+			params = {'private_access': params_form.private_access.data,
+					'encryption': params_form.encryption.data,
+					'change_possibility': params_form.change_possibility.data}
+		try:
+			note = bulk.create_note(url_id, note_form.title.data,
+						note_form.text.data, viewer_id_of(current_user), params,
+						app.config['NOTE_CREATE_ATTEMPTS'])
+		except IntegrityError:
+			flash('Some error...')
+		else:
+			flash('{}th note'.format(note.id))
+			if note_form.publish.data:
+				return redirect(url_for('note_view', url_id=note.url_id))
+			return redirect(url_for('note_edit', url_id=note.url_id))
+	note_form.revision.data = 0
+
+	return render_template('note_edit.html', url_id=url_id, note_form=note_form, params_form=params_form,
+				grants=None, draft=True)
+
 
-	return redirect(url_for('note_edit', url_id=new_url_id))
+def private_note_redirect(access):
+	flash("This note under private control, don't touch that!11)00")
+	return redirect(url_for('user_notes', username=access.owner_username))
 
 
 @app.route('/edit/<string:url_id>', methods=['GET', 'POST'])
 def note_edit(url_id):
-	note = db.session.query(Note).filter_by(url_id=url_id).first()
-	if not note:
+	access = resolve_note_access(url_id, current_user)
+	if not access:
+		if is_draft_of(request.args.get('draft'), url_id,
+						viewer_id_of(current_user)):
+			return note_draft_edit(url_id)
 		return jsonify('404: Not Found'), 404
+	if not access.permissions.can_view:
+		return private_note_redirect(access)
+	if not access.permissions.can_edit:
+		return redirect(url_for('note_view', url_id=url_id))
 
+	note, params = access.note, access.params
 	params_form = None
 	note_form = NoteForm(formdata=request.form, obj=note)
-	params = db.session.query(UserNoteParams).filter_by(
-										note_id=note.id).first()
-	if params:
-		if current_user.is_authenticated \
-			and params.user_id == current_user.id:
-			params_form = UserNoteParamsForm(formdata=request.form, obj=params)
+	if access.permissions.is_owner:
+		params_form = UserNoteParamsForm(formdata=request.form, obj=params)
+		if request.method != 'POST':
+			# empty formdata would reset the checkboxes to False
 			params_form.private_access.data = params.private_access
 			params_form.encryption.data = params.encryption
 			params_form.change_possibility.data = params.change_possibility
-		else:
-			if params.private_access:
-				username = User.query.get(params.user_id).username
-				flash("This note under private control, don't touch that!11)00")
-				return redirect(url_for('user_notes', username=username))
-			if not params.change_possibility or params.encryption:
-				return redirect(url_for('note_view', url_id=url_id))
 	if request.method == 'POST' and note_form.validate_on_submit():
-		if params_form:
-			flash(f'{params.private_access}')
-			params.private_access = params_form.private_access.data
-			
-			flash(f'{params_form.private_access.data}')
-			flash(f'{params.private_access} {params.encryption}')
-			params.encryption = params_form.encryption.data
-			params.change_possibility = params_form.change_possibility.data
-		note.title = note_form.title.data
-		note.text = note_form.text.data
-		flash('Information updated')
+		# on a conflict the submitted title and text stay in the form,
+		# based on the current revision so that saving again overwrites it
+		if note_form.revision.data and note_form.revision.data != note.revision:
+			flash('The note was changed elsewhere, review it and save again')
+		else:
+			if params_form:
+				if bool(params.private_access) != params_form.private_access.data:
+					stats.privacy_changed(params.user_id,
+								params_form.private_access.data)
+				params.private_access = params_form.private_access.data
+				params.encryption = params_form.encryption.data
+				params.change_possibility = params_form.change_possibility.data
+			save_note(note, note_form.title.data, note_form.text.data,
+					viewer_id_of(current_user))
+			index_note(note)
+			response_cache.invalidate_note(url_id)
+			response_cache.invalidate_feed()
+			try:
+				db.session.commit()
+			except StaleDataError:
+				db.session.rollback()
+				flash('The note was changed elsewhere, review it and save again')
+			else:
+				flash('Information updated')
+				if note_form.publish.data:
+					return redirect(url_for('note_view', url_id=url_id))
+	# IntegerField renders the submitted value over .data
+	note_form.revision.raw_data = None
+	note_form.revision.data = note.revision
+
+	grants = None
+	if access.permissions.is_owner:
+		grants = note_grants_query(note.id).all()
+	return render_template('note_edit.html', url_id=url_id, note_form=note_form, params_form=params_form,
+				grants=grants, share_form=ShareForm(formdata=None),
+				revoke_form=RevokeForm(formdata=None))
+
+
+@app.route('/edit/<string:url_id>/share', methods=['POST'])
+@login_required
+def note_share(url_id):
+	access = resolve_note_access(url_id, current_user, with_text=False)
+	if not access:
+		return jsonify('404: Not Found'), 404
+	if not access.permissions.is_owner:
+		flash('Only the owner can share this note')
+		return redirect(url_for('note_view', url_id=url_id))
+
+	form = ShareForm()
+	if form.validate_on_submit():
+		user = get_user_by_username(form.username.data)
+		if not user:
+			flash('User "{}" not found'.format(form.username.data))
+		elif user.id == current_user.id:
+			flash('The note is already yours')
+		else:
+			try:
+				db.session.add(PrivateAccess(note_id=access.note.id,
+											user_id=user.id))
+				db.session.commit()
+				flash('Shared with "{}"'.format(user.username))
+			except IntegrityError:
+				db.session.rollback()
+				flash('Already shared with "{}"'.format(user.username))
+	else:
+		for fieldName, errorMessages in form.errors.items():
+			flash('{}: {}'.format(fieldName, errorMessages))
+	return redirect(url_for('note_edit', url_id=url_id))
+
+
+@app.route('/edit/<string:url_id>/share/<int:user_id>/revoke', methods=['POST'])
+@login_required
+def note_revoke(url_id, user_id):
+	access = resolve_note_access(url_id, current_user, with_text=False)
+	if not access:
+		return jsonify('404: Not Found'), 404
+	if not access.permissions.is_owner:
+		flash('Only the owner can share this note')
+		return redirect(url_for('note_view', url_id=url_id))
+
+	if RevokeForm().validate_on_submit():
+		try:
+			db.session.query(PrivateAccess)\
+				.filter(PrivateAccess.note_id == access.note.id,
+						PrivateAccess.user_id == user_id)\
+				.delete(synchronize_session=False)
+			db.session.commit()
+			flash('Access revoked')
+		except:
+			flash('Some error...')
+			db.session.rollback()
+	return redirect(url_for('note_edit', url_id=url_id))
+
+
+@app.route('/edit/<string:url_id>/autosave', methods=['POST'])
+def note_autosave(url_id):
+	"""Apply a text delta against `base` revision; JSON in and out.
+
+	Permissions are those of note_edit. A stale `base` gets 409 with the
+	current revision so the editor can reload before saving again.
+	"""
+	if app.config.get('WTF_CSRF_ENABLED', True):
+		try:
+			validate_csrf(request.headers.get('X-CSRFToken'))
+		except ValidationError:
+			return jsonify('400: Bad Request'), 400
+	payload = request.get_json(silent=True)
+	if not isinstance(payload, dict) or not isinstance(payload.get('base'), int):
+		return jsonify('400: Bad Request'), 400
+
+	access = resolve_note_access(url_id, current_user)
+	if not access:
+		return jsonify('404: Not Found'), 404
+	if not access.permissions.can_edit:
+		return jsonify('403: Forbidden'), 403
+
+	note = access.note
+	if payload['base'] != note.revision:
+		return jsonify(error='conflict', revision=note.revision), 409
+	try:
+		# the editor counts positions on LF text, older notes may hold CRLF
+		text = apply_ops(normalize_newlines(note.text), payload.get('ops', []))
+	except DeltaError as error:
+		return jsonify(error=str(error)), 400
+	title = payload.get('title', note.title)
+	if not isinstance(title, str) or not title.strip() or len(title) > 100:
+		return jsonify('400: Bad Request'), 400
+	save_note(note, title, text, viewer_id_of(current_user))
+	index_note(note)
+	response_cache.invalidate_note(url_id)
+	response_cache.invalidate_feed()
+	try:
 		db.session.commit()
-		if note_form.publish.data:
-			return redirect(url_for('note_view', url_id=url_id))
+	except StaleDataError:
+		db.session.rollback()
+		return jsonify(error='conflict',
+				revision=db.session.query(Note.revision)
+						.filter(Note.url_id == url_id).scalar()), 409
+	return jsonify(revision=note.revision, length=len(text))
 
-	return render_template('note_edit.html', url_id=url_id, note_form=note_form, params_form=params_form)
+
+@app.route('/edit/<string:url_id>/history')
+@replica_reads
+def note_history(url_id):
+	access = resolve_note_access(url_id, current_user, with_text=False)
+	if not access:
+		return jsonify('404: Not Found'), 404
+	if not access.permissions.can_view:
+		return private_note_redirect(access)
+
+	revisions = revisions_query(access.note.id)
+	before = request.args.get('before', type=int)
+	if before is not None:
+		revisions = revisions.filter(NoteRevision.revision < before)
+	per_page = app.config['NOTE_HISTORY_PER_PAGE']
+	rows = revisions.limit(per_page + 1).all()
+	return render_template('note_history.html', note=access.note,
+				revisions=rows[:per_page],
+				older=rows[per_page - 1].revision if len(rows) > per_page else None,
+				permissions=access.permissions, restore_form=RestoreForm())
+
+
+@app.route('/edit/<string:url_id>/history/<int:revision>', methods=['GET', 'POST'])
+def note_history_revision(url_id, revision):
+	# only a restore compares against the current body
+	access = resolve_note_access(url_id, current_user,
+				with_text=request.method == 'POST')
+	if not access:
+		return jsonify('404: Not Found'), 404
+	if not access.permissions.can_view:
+		return private_note_redirect(access)
+
+	note, params = access.note, access.params
+	found = note_revision(note.id, revision)
+	if not found:
+		return jsonify('404: Not Found'), 404
+	stored, text = found
+	restore_form = RestoreForm()
+	if restore_form.validate_on_submit():
+		if not access.permissions.can_edit:
+			return redirect(url_for('note_view', url_id=url_id))
+		try:
+			if save_note(note, stored.title, text, viewer_id_of(current_user)):
+				index_note(note)
+				response_cache.invalidate_note(url_id)
+				response_cache.invalidate_feed()
+			db.session.commit()
+			flash('Revision {} restored'.format(revision))
+			return redirect(url_for('note_edit', url_id=url_id))
+		except StaleDataError:
+			db.session.rollback()
+			flash('The note was changed elsewhere, review it and save again')
+			return redirect(url_for('note_history', url_id=url_id))
+
+	return render_template('note_revision.html', note=note, stored=stored,
+				text=text, params=params, permissions=access.permissions,
+				restore_form=restore_form)
 
 
 @app.route('/view/<string:url_id>')
+@replica_reads
 def note_view(url_id):
-	note = get_note_by_url_id(url_id)
-	if not note:
+	return response_cache.serve(response_cache.note_key(url_id),
+			lambda: render_note_view(url_id))
+
+
+def render_note_view(url_id):
+	access = resolve_note_access(url_id, current_user, with_text=False)
+	if not access:
 		return jsonify('404: Not Found'), 404
-	params = UserNoteParams.query.filter_by(note_id=note.id).first()
-	if params:
-		if (current_user.is_authenticated \
-				and params.user_id == current_user.id) \
-				or not params.private_access:
-			return render_template('note_view.html', note=note, params=params)
-		else:
-			author = User.query.get(params.user_id)
-			flash("This note under private control, don't touch that!11)00")
-			return redirect(url_for('user_notes', username=author.username))
-	return render_template('note_view.html', note=note, params=None)
+	if not access.permissions.can_view:
+		return private_note_redirect(access)
+
+	note, params = access.note, access.params
+	etag = make_etag(note.id, note.updated, viewer_key(current_user),
+				tuple(access.permissions), params and params.encryption)
+	return conditional_response(etag, note.updated,
+			lambda: render_template('note_view.html', note=note,
+				params=params, permissions=access.permissions),
+			public=current_user.is_anonymous)
 
 
 @app.route('/edit/<string:url_id>/delete')
 def note_delete(url_id):
-	note = db.session.query(Note).filter_by(url_id=url_id).first()
-	params = db.session.query(UserNoteParams).filter_by(note_id=note.id).first()
-	if params:
-		if not current_user.is_authenticated \
-			or params.user_id != current_user.id:
-			flash("You have not rights to delete this note!11")
-			return redirect(url_for('note_view', url_id=url_id))
+	access = resolve_note_access(url_id, current_user, with_text=False)
+	if not access:
+		return jsonify('404: Not Found'), 404
+	if not access.permissions.can_delete:
+		flash("You have not rights to delete this note!11")
+		return redirect(url_for('note_view', url_id=url_id))
+
+	note = access.note
+	try:
+		bulk.delete_notes([note.id])
+		db.session.commit()
+		flash("{}th note was deleted".format(note.id))
+	except:
+		flash('Some error...')
+		db.session.rollback()
 
-	accesses = db.session.query(PrivateAccess).filter_by(note_id=note.id).all()
-	for access in accesses:
-		db_session_delete(access, err_msg='did not have accesses')
-	db_session_delete(params, err_msg='did not have params')
-	db_session_delete(note, "{}th note was deleted".format(note.id))
-	
 	return redirect(url_for('index'))
 
 
 @app.route('/user/<string:username>')
+@replica_reads
 @quote_kw_args
 def user_notes(username):
 	# unquote from percent-encoding
@@ -253,16 +540,84 @@ def user_notes(username):
 	if not user:
 		return jsonify('404: Not Found'), 404
 
-	if current_user.is_authenticated \
-		and current_user.username == user.username:
-		params = UserNoteParams.query.filter_by(user_id=user.id).all()
+	notes = user_notes_query(user.id, include_private=
+				current_user.is_authenticated \
+				and current_user.username == user.username,
+				viewer_id=viewer_id_of(current_user))
+	page = listing_page(notes, request.args.get('after'),
+				request.args.get('before'), app.config['NOTES_PER_PAGE'])
+	return stream_template('user_notes.html', username=username, notes=page)
+
+
+@app.route('/shared')
+@login_required
+@replica_reads
+def shared_notes():
+	# grants are paged by id, newest first, along their (user_id, id) index
+	page = id_page(shared_notes_query(current_user.id), PrivateAccess.id,
+				after=request.args.get('after', type=int),
+				before=request.args.get('before', type=int),
+				per_page=app.config['NOTES_PER_PAGE'])
+	return render_template('shared_notes.html', notes=page)
+
+
+@app.route('/user/<string:username>/export')
+@replica_reads
+@quote_kw_args
+def user_notes_export(username):
+	username = unquote(username)
+	user = get_user_by_username(username)
+	if not user:
+		return jsonify('404: Not Found'), 404
+
+	records = transfer.export_records(user.id, include_private=
+				current_user.is_authenticated \
+				and current_user.username == user.username,
+				viewer_id=viewer_id_of(current_user),
+				batch_size=app.config['EXPORT_BATCH_SIZE'])
+	export_format = request.args.get('format', 'ndjson')
+	if export_format == 'zip':
+		body, mimetype = transfer.zip_chunks(records), 'application/zip'
+	elif export_format == 'ndjson':
+		body, mimetype = transfer.ndjson_chunks(records), 'application/x-ndjson'
 	else:
-		params = UserNoteParams.query.filter_by(
-					user_id=user.id, private_access=False).all()
-	notes = []
-	for param in params:
-		notes.append(Note.query.get(param.note_id))
-	return render_template('user_notes.html', username=username, notes=notes)
+		return jsonify('400: Bad Request'), 400
+	response = app.response_class(stream_with_context(body), mimetype=mimetype)
+	response.headers['Content-Disposition'] = \
+		'attachment; filename="{}-notes.{}"'.format(quote(username), export_format)
+	return response
+
+
+@app.route('/user/<string:username>/import', methods=['GET', 'POST'])
+@login_required
+@quote_kw_args
+def user_notes_import(username):
+	username = unquote(username)
+	if username != current_user.username:
+		flash("You have not rights to import notes of this user!11")
+		return redirect(url_for('user_notes', username=username))
+
+	form = ImportForm()
+	if form.validate_on_submit():
+		stream = form.archive.data.stream
+		try:
+			take_bulk_create_token()
+			count = transfer.import_notes(current_user.id,
+						transfer.read_records(stream),
+						app.config['IMPORT_CHUNK_SIZE'])
+			flash('{} notes imported'.format(count))
+			return redirect(url_for('user_notes', username=username))
+		except RateLimited as error:
+			flash('Too many imports, try again in {} seconds'.format(
+				retry_after_header(error.retry_after)))
+			return render_template('notes_import.html', form=form,
+						username=username), 429, \
+				{'Retry-After': retry_after_header(error.retry_after)}
+		except transfer.ImportFormatError as error:
+			flash('Import stopped at {}, {} notes imported before it'.format(
+				error, error.imported))
+
+	return render_template('notes_import.html', form=form, username=username)
 
 
 @app.route('/profile', methods=['GET', 'POST'])
@@ -273,6 +628,7 @@ def profile():
 	if request.method == 'POST' and form.validate_on_submit():
 		if user.check_password(form.curr_password.data):
 			try:
+				username_index.renamed(user.username, form.username.data)
 				user.username = form.username.data
 				user.email = form.email.data
 				if form.new_password.data:
@@ -280,9 +636,14 @@ def profile():
 						user.password = form.new_password.data
 					else:
 						flash('new_password: length must be between 8 and 40')
+				response_cache.invalidate_feed()
 				db.session.commit()
+				forget_principal(user.id)
 				flash('Information updated')
 				return redirect(url_for('profile'))
+			except HashingBusy:
+				db.session.rollback()
+				raise
 			except:
 				flash('Some error...')
 				db.session.rollback()
@@ -298,21 +659,39 @@ def profile():
 @app.route('/profile/delete/<int:user_id>')
 @login_required
 def profile_delete(user_id):
-	params = db.session.query(UserNoteParams).filter_by(user_id=user_id).all()
-	accesses = db.session.query(PrivateAccess).filter_by(user_id=user_id).all()
-	for access in accesses:
-		db_session_delete(access, err_msg='did not have accesses')
-	for param in params:
-		note = db.session.query(Note).get(param.note_id)
-		db_session_delete(note,
-			err_msg='problem via {}th note deleting'.format(param.note_id))
-		db_session_delete(param, err_msg='did not have params')
-	user = db.session.query(User).get(user_id)
-	db_session_delete(user, "{}'s Profile was deleted".format(user.username))
-	
+	if user_id != current_user.id:
+		flash("You have not rights to delete this profile!11")
+		return redirect(url_for('profile'))
+
+	username = current_user.username
+	notes_count = bulk.count_user_notes(user_id)
+	if notes_count > app.config['BULK_DELETE_SYNC_LIMIT']:
+		job = bulk.start_deletion_job(user_id, notes_count,
+						app.config['BULK_DELETE_CHUNK_SIZE'])
+		logout_user()
+		flash("{}'s Profile is being deleted, progress: {}".format(
+			username, url_for('deletion_job', job_id=job.id)))
+		return redirect(url_for('login'))
+
+	try:
+		bulk.delete_user(user_id, app.config['BULK_DELETE_CHUNK_SIZE'])
+		forget_principal(user_id)
+		logout_user()
+		flash("{}'s Profile was deleted".format(username))
+	except:
+		flash('Some error...')
+
 	return redirect(url_for('login'))
 
 
+@app.route('/jobs/delete/<string:job_id>')
+def deletion_job(job_id):
+	job = bulk.get_deletion_job(job_id)
+	if not job:
+		return jsonify('404: Not Found'), 404
+	return jsonify(job.as_dict())
+
+
 @app.route('/login', methods=['GET', 'POST'])
 def login():
 	if current_user.is_authenticated:
@@ -323,6 +702,9 @@ def login():
 		user = get_user_by_username(form.username.data)
 		if user:
 			if user.check_password(form.password.data):
+				if user.password_needs_rehash():
+					user.password = form.password.data
+					db.session.commit()
 				login_user(user, remember=form.remember_me.data)
 
 				flash('Entered as user "{}", remember_me={}'.format(
@@ -347,6 +729,7 @@ def register():
 							password=form.password.data,
 							email=form.email.data)
 
+			username_index.added(new_user.username)
 			message = 'Sign Up requested for user "{}"'.format(form.username.data)
 			db_session_add(new_user, message)
 
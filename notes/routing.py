@@ -0,0 +1,105 @@
+"""Read/write routing between the primary database and read replicas.
+
+Replicas are ordinary Flask-SQLAlchemy binds named `replica_<n>` (see
+Config). Views wrapped in `replica_reads` send their SELECTs to one of
+them; flushes, INSERT/UPDATE/DELETE statements and everything after the
+first write of a request stay on the primary. A client that has just
+written reads from the primary for REPLICA_STICKY_SECONDS, so the page a
+save redirects to never shows the replica's older copy. Pages built for
+the shared response cache always read the primary, see cache.py.
+"""
+import random
+from functools import wraps
+from time import time
+from flask import current_app, g, has_request_context, session as client_session
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.sql import Select
+
+
+REPLICA_BIND_PREFIX = 'replica_'
+PRIMARY_UNTIL = 'primary_until'
+
+
+class RoutingSession(SignallingSession):
+	def __init__(self, db, **options):
+		self.db = db
+		SignallingSession.__init__(self, db, **options)
+
+	def get_bind(self, mapper=None, clause=None):
+		if self._flushing or (clause is not None
+							and not isinstance(clause, Select)):
+			# read-after-write inside the request stays on the primary
+			self.info['wrote'] = True
+		elif self.info.get('use_replica') and not self.info.get('wrote'):
+			bind = self.info.get('replica')
+			if bind is None:
+				binds = self.db.replica_binds()
+				if binds:
+					bind = self.info['replica'] = random.choice(binds)
+			if bind is not None:
+				return self.db.get_engine(self.app, bind=bind)
+		return SignallingSession.get_bind(self, mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+	def init_app(self, app):
+		app.config.setdefault('REPLICA_ENGINE_OPTIONS', {})
+		app.config.setdefault('REPLICA_STICKY_SECONDS', 5)
+		SQLAlchemy.init_app(self, app)
+		app.after_request(remember_write)
+
+	def create_session(self, options):
+		factory = orm.sessionmaker(class_=RoutingSession, db=self, **options)
+		event.listen(factory, 'after_commit', note_write)
+		return factory
+
+	def make_connector(self, app=None, bind=None):
+		connector = SQLAlchemy.make_connector(self, app, bind)
+		if bind is not None and bind.startswith(REPLICA_BIND_PREFIX):
+			get_options = connector.get_options
+
+			def replica_options(sa_url, echo):
+				options = get_options(sa_url, echo)
+				options.update(connector._app.config['REPLICA_ENGINE_OPTIONS'])
+				return options
+			connector.get_options = replica_options
+		return connector
+
+	def replica_binds(self, app=None):
+		binds = self.get_app(app).config.get('SQLALCHEMY_BINDS') or {}
+		return sorted(bind for bind in binds
+					if bind.startswith(REPLICA_BIND_PREFIX))
+
+	def use_replica(self):
+		"""Send this request's reads to a replica, unless it just wrote."""
+		if not self.replica_binds():
+			return
+		if client_session.get(PRIMARY_UNTIL, 0) > time():
+			return
+		self.session.info['use_replica'] = True
+
+	def use_primary(self):
+		"""Send the rest of this request's reads to the primary."""
+		self.session.info['use_replica'] = False
+
+
+def replica_reads(view):
+	@wraps(view)
+	def wrap(*args, **kwargs):
+		get_state(current_app).db.use_replica()
+		return view(*args, **kwargs)
+	return wrap
+
+
+def note_write(session):
+	if session.info.get('wrote') and has_request_context():
+		g.db_wrote = True
+
+
+def remember_write(response):
+	if g.pop('db_wrote', False) \
+			and get_state(current_app).db.replica_binds():
+		client_session[PRIMARY_UNTIL] = \
+			time() + current_app.config['REPLICA_STICKY_SECONDS']
+	return response
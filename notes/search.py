@@ -0,0 +1,225 @@
+import re
+from collections import Counter
+from markupsafe import Markup, escape
+from sqlalchemy import or_, func, case
+from sqlalchemy.orm import undefer_group
+from notes import db
+from .models import Note, User, UserNoteParams, NoteSearchToken
+from .compression import unpack_text
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+MIN_TERM_LENGTH = 2
+MAX_TERM_LENGTH = 40
+TITLE_WEIGHT = 5
+
+
+def tokenize(text):
+	if not text:
+		return []
+	return [term for term in TOKEN_RE.findall(text.lower())
+			if MIN_TERM_LENGTH <= len(term) <= MAX_TERM_LENGTH]
+
+
+def query_terms(query):
+	# unique terms in input order, the AND-set a document has to contain
+	return list(dict.fromkeys(tokenize(query)))
+
+
+def note_term_weights(title, text):
+	weights = Counter(tokenize(text))
+	for term in tokenize(title):
+		weights[term] += TITLE_WEIGHT
+	return weights
+
+
+def note_postings(note_id, title, text):
+	"""NoteSearchToken rows of one note."""
+	title_terms = set(tokenize(title))
+	return [{'term': term, 'note_id': note_id, 'weight': weight,
+			'in_title': term in title_terms}
+			for term, weight in note_term_weights(title, text).items()]
+
+
+def body_visible(viewer_id=None):
+	"""Whether `viewer_id` may read the body of a note joined with its
+	UserNoteParams: encrypted bodies are for their owner only."""
+	visible = or_(UserNoteParams.id == None,
+				UserNoteParams.encryption == None,
+				UserNoteParams.encryption == False)
+	if viewer_id is not None:
+		visible = or_(visible, UserNoteParams.user_id == viewer_id)
+	return visible
+
+
+def unindex_notes(note_ids):
+	if note_ids:
+		db.session.query(NoteSearchToken)\
+			.filter(NoteSearchToken.note_id.in_(note_ids))\
+			.delete(synchronize_session=False)
+
+
+def index_note(note):
+	"""Replace the postings of `note` inside the caller's transaction."""
+	unindex_notes([note.id])
+	rows = note_postings(note.id, note.title, note.text)
+	if rows:
+		db.session.execute(NoteSearchToken.__table__.insert(), rows)
+
+
+def index_new_notes(notes):
+	"""Postings for freshly inserted (note_id, title, text) in one statement."""
+	rows = [row for note_id, title, text in notes
+			for row in note_postings(note_id, title, text)]
+	if rows:
+		db.session.execute(NoteSearchToken.__table__.insert(), rows)
+
+
+def reindex_all(batch_size=500):
+	db.session.query(NoteSearchToken).delete(synchronize_session=False)
+	last_id = 0
+	while True:
+		notes = Note.query.options(undefer_group('body'))\
+					.filter(Note.id > last_id)\
+					.order_by(Note.id).limit(batch_size).all()
+		if not notes:
+			break
+		rows = [row for note in notes
+				for row in note_postings(note.id, note.title, note.text)]
+		if rows:
+			db.session.execute(NoteSearchToken.__table__.insert(), rows)
+		db.session.commit()
+		last_id = notes[-1].id
+		db.session.expunge_all()
+
+
+def search_query(terms, viewer_id=None):
+	"""Notes containing every one of `terms`, best match first.
+
+	Rows carry id, title, url_id, updated, username and score. Private
+	notes are only returned to their owner. Encrypted notes of others
+	only match on their title, and rank by it alone, so their body
+	cannot be probed term by term.
+	"""
+	title_hit = case([(NoteSearchToken.in_title == True, 1)], else_=0)
+	ranked = db.session.query(NoteSearchToken.note_id,
+					func.sum(NoteSearchToken.weight).label('score'),
+					func.sum(title_hit).label('title_hits'))\
+				.filter(NoteSearchToken.term.in_(terms))\
+				.group_by(NoteSearchToken.note_id)\
+				.having(func.count(NoteSearchToken.term) == len(terms))\
+				.subquery()
+
+	visible = or_(UserNoteParams.id == None,
+				UserNoteParams.private_access == False)
+	if viewer_id is not None:
+		visible = or_(visible, UserNoteParams.user_id == viewer_id)
+	readable = body_visible(viewer_id)
+	score = case([(readable, ranked.c.score)],
+				else_=ranked.c.title_hits * TITLE_WEIGHT).label('score')
+
+	return db.session.query(Note.id, Note.title, Note.url_id,
+						Note.updated, User.username, score)\
+				.join(ranked, ranked.c.note_id == Note.id)\
+				.join(UserNoteParams,
+					UserNoteParams.note_id == Note.id, isouter=True)\
+				.join(User,
+					User.id == UserNoteParams.user_id, isouter=True)\
+				.filter(visible,
+						or_(readable, ranked.c.title_hits == len(terms)))\
+				.order_by(score.desc(), Note.updated.desc())
+
+
+def search_notes(query, viewer_id=None, page=1, per_page=20):
+	"""One page of `search_query` results as (rows, has_more)."""
+	terms = query_terms(query)
+	if not terms:
+		return [], False
+	rows = search_query(terms, viewer_id)\
+				.limit(per_page + 1).offset((page - 1) * per_page).all()
+	return rows[:per_page], len(rows) > per_page
+
+
+class SearchResults:
+	"""One page of results as (row, snippet) pairs, fetched while iterated.
+
+	Rows are read `batch_size` at a time and every batch gets its snippets
+	from a single query, so a streamed page holds one batch at most; the
+	default batch is the whole page. `has_more` is known once the page has
+	been read.
+	"""
+	def __init__(self, query, viewer_id=None, page=1, per_page=20,
+				snippet_length=160, batch_size=None):
+		self.query = query
+		self.viewer_id = viewer_id
+		self.page = page
+		self.per_page = per_page
+		self.snippet_length = snippet_length
+		self.batch_size = batch_size or per_page + 1
+		self.has_more = False
+
+	def __iter__(self):
+		terms = query_terms(self.query)
+		if not terms:
+			return
+		rows = search_query(terms, self.viewer_id)\
+					.limit(self.per_page + 1)\
+					.offset((self.page - 1) * self.per_page)\
+					.yield_per(self.batch_size)
+		batch = []
+		count = 0
+		for row in rows:
+			if count == self.per_page:
+				self.has_more = True
+				continue
+			count += 1
+			batch.append(row)
+			if len(batch) == self.batch_size:
+				yield from self._with_snippets(batch)
+				batch = []
+		yield from self._with_snippets(batch)
+
+	def _with_snippets(self, rows):
+		snippets = note_snippets([row.id for row in rows], self.query,
+								self.snippet_length, self.viewer_id)
+		for row in rows:
+			yield row, snippets.get(row.id, '')
+
+
+def note_snippets(note_ids, query, length=160, viewer_id=None):
+	"""Highlighted excerpts for one page of results, keyed by note id.
+
+	Encrypted notes get none unless `viewer_id` owns them.
+	"""
+	if not note_ids:
+		return {}
+	terms = query_terms(query)
+	pattern = re.compile('|'.join(map(re.escape, terms)), re.IGNORECASE) \
+				if terms else None
+	texts = db.session.query(Note.id, Note._text, Note.text_z)\
+				.join(UserNoteParams,
+					UserNoteParams.note_id == Note.id, isouter=True)\
+				.filter(Note.id.in_(note_ids), body_visible(viewer_id)).all()
+	return {note_id: highlight(unpack_text(text, text_z) or '', pattern, length)
+			for note_id, text, text_z in texts}
+
+
+def highlight(text, pattern, length):
+	match = pattern.search(text) if pattern else None
+	start = max(0, match.start() - length // 3) if match else 0
+	excerpt = text[start:start + length]
+
+	parts = []
+	pos = 0
+	for found in (pattern.finditer(excerpt) if pattern else ()):
+		parts.append(escape(excerpt[pos:found.start()]))
+		parts.append(Markup('<mark>{}</mark>').format(found.group()))
+		pos = found.end()
+	parts.append(escape(excerpt[pos:]))
+
+	snippet = Markup('').join(parts)
+	if start > 0:
+		snippet = Markup('&hellip;') + snippet
+	if start + length < len(text):
+		snippet += Markup('&hellip;')
+	return snippet
@@ -0,0 +1,102 @@
+from sqlalchemy import func, case
+from notes import db
+from .models import Note, User, UserNoteParams, NoteCounter, UserNoteStats
+from .upsert import increment
+
+
+ANONYMOUS_NOTES = 'anonymous_notes'
+USER_NOTES = 'user_notes'
+
+# All helpers below only stage UPDATE/INSERT statements in the current
+# session, so the counters commit or roll back together with the write
+# that caused them. `manage.py rebuild_stats` repairs any drift.
+
+
+def bump_counter(name, delta):
+	increment(NoteCounter.__table__, {'name': name}, {'value': delta})
+
+
+def bump_user_stats(user_id, notes=0, public=0):
+	increment(UserNoteStats.__table__, {'user_id': user_id},
+			{'notes_count': notes, 'public_notes_count': public})
+
+
+def note_created(user_id=None, private_access=True):
+	if user_id is None:
+		bump_counter(ANONYMOUS_NOTES, 1)
+	else:
+		bump_counter(USER_NOTES, 1)
+		bump_user_stats(user_id, 1, 0 if private_access else 1)
+
+
+def notes_created(user_id=None, count=1, public=0):
+	if user_id is None:
+		bump_counter(ANONYMOUS_NOTES, count)
+	else:
+		bump_counter(USER_NOTES, count)
+		bump_user_stats(user_id, count, public)
+
+
+def note_deleted(user_id=None, private_access=True):
+	if user_id is None:
+		bump_counter(ANONYMOUS_NOTES, -1)
+	else:
+		bump_counter(USER_NOTES, -1)
+		bump_user_stats(user_id, -1, 0 if private_access else -1)
+
+
+def privacy_changed(user_id, private_access):
+	bump_user_stats(user_id, public=-1 if private_access else 1)
+
+
+def user_deleted(user_id, notes_count):
+	bump_counter(USER_NOTES, -notes_count)
+	db.session.query(UserNoteStats).filter_by(user_id=user_id)\
+		.delete(synchronize_session=False)
+
+
+def rebuild_stats():
+	"""Recompute every counter from the note tables in one transaction."""
+	user_notes = db.session.query(func.count(UserNoteParams.id)).scalar()
+	all_notes = db.session.query(func.count(Note.id)).scalar()
+
+	db.session.query(NoteCounter).delete(synchronize_session=False)
+	db.session.execute(NoteCounter.__table__.insert(), [
+		{'name': ANONYMOUS_NOTES, 'value': all_notes - user_notes},
+		{'name': USER_NOTES, 'value': user_notes}])
+
+	per_user = db.session.query(UserNoteParams.user_id,
+					func.count(UserNoteParams.id),
+					func.sum(case([(UserNoteParams.private_access == False, 1)],
+								else_=0)))\
+				.filter(UserNoteParams.user_id != None)\
+				.group_by(UserNoteParams.user_id).all()
+	db.session.query(UserNoteStats).delete(synchronize_session=False)
+	rows = [{'user_id': user_id, 'notes_count': count,
+			'public_notes_count': int(public or 0)}
+			for user_id, count, public in per_user]
+	if rows:
+		db.session.execute(UserNoteStats.__table__.insert(), rows)
+	db.session.commit()
+
+
+def notes_type_counts_query():
+	return db.session.query(NoteCounter.name, NoteCounter.value)\
+				.filter(NoteCounter.name.in_([ANONYMOUS_NOTES, USER_NOTES]))
+
+
+def notes_type_counts():
+	counters = dict(notes_type_counts_query().all())
+	return [counters.get(ANONYMOUS_NOTES, 0), counters.get(USER_NOTES, 0)]
+
+
+def top_authors_query(limit):
+	return db.session.query(User.username, UserNoteStats.notes_count)\
+				.join(User, User.id == UserNoteStats.user_id)\
+				.filter(UserNoteStats.notes_count > 0)\
+				.order_by(UserNoteStats.notes_count.desc())\
+				.limit(limit)
+
+
+def top_authors(limit):
+	return top_authors_query(limit).all()
@@ -0,0 +1,39 @@
+from flask import (
+	current_app, render_template, stream_with_context, get_flashed_messages
+)
+from flask.signals import before_render_template, template_rendered
+from flask_login import current_user
+
+
+def streaming_enabled():
+	return current_app.config['STREAM_TEMPLATES']
+
+
+def stream_template(template_name, **context):
+	"""Response rendering `template_name` while it is being sent.
+
+	The body is Jinja's `generate()` stream, so the page header goes out
+	before a lazily iterated listing has been fetched and every row is
+	sent as soon as it is rendered. The headers, and with them the session
+	cookie, are sent before the template runs: flashed messages are popped
+	and the user is loaded here rather than from the template.
+	With STREAM_TEMPLATES off this is plain `render_template`.
+	"""
+	if not streaming_enabled():
+		return render_template(template_name, **context)
+	app = current_app._get_current_object()
+	get_flashed_messages()
+	current_user.is_authenticated
+	app.update_template_context(context)
+	template = app.jinja_env.get_or_select_template(template_name)
+
+	def generate():
+		before_render_template.send(app, template=template, context=context)
+		stream = template.stream(context)
+		stream.enable_buffering(app.config['STREAM_BUFFER_SIZE'])
+		for chunk in stream:
+			yield chunk
+		template_rendered.send(app, template=template, context=context)
+
+	return app.response_class(stream_with_context(generate()),
+							mimetype='text/html')
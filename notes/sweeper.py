@@ -0,0 +1,165 @@
+import threading
+from datetime import datetime, timedelta
+from time import monotonic, sleep
+from sqlalchemy import and_, or_
+from notes import app, db
+from .models import Note
+from .bulk import delete_notes
+from .metrics import Counter, Gauge, register
+
+
+swept_notes = register(Counter('notes_sweeper_notes_total',
+	'Empty notes found by the sweeper.', ('action',)))
+sweep_batches = register(Counter('notes_sweeper_batches_total',
+	'Sweeper batches run.'))
+_last_sweep = {}
+last_sweep = register(Gauge('notes_sweeper_last_run_timestamp',
+	'Unix time the last sweep finished.', (),
+	lambda: [((), value) for value in _last_sweep.values()]))
+
+
+def empty_note():
+	return and_(or_(Note.title == None, Note.title == ''),
+				or_(Note._text == None, Note._text == ''),
+				Note.text_z == None)
+
+
+def untouched_since(cutoff):
+	return or_(Note.updated < cutoff,
+				and_(Note.updated == None, Note.created < cutoff))
+
+
+class SweepReport:
+	def __init__(self, dry_run=False):
+		self.dry_run = dry_run
+		self.batches = 0
+		self.max_id = 0
+		self.found = 0
+		self.deleted = 0
+		self.last_id = 0
+		self.started = monotonic()
+
+	def as_dict(self):
+		return {
+			'dry_run': self.dry_run,
+			'batches': self.batches,
+			'found': self.found,
+			'deleted': self.deleted,
+			'last_id': self.last_id,
+			'max_id': self.max_id,
+			'seconds': round(monotonic() - self.started, 3),
+		}
+
+
+def window_end(last_id, size):
+	"""Id of the `size`-th note after `last_id`, read off the primary key."""
+	upper = db.session.query(Note.id).filter(Note.id > last_id)\
+				.order_by(Note.id).offset(size - 1).limit(1).scalar()
+	if upper is None:
+		upper = db.session.query(db.func.max(Note.id))\
+					.filter(Note.id > last_id).scalar()
+	return upper
+
+
+def sweep_empty_notes(older_than, batch_size=500, pause=0.5, rate=0,
+					dry_run=False, max_batches=None, progress=None):
+	"""Delete notes still empty `older_than` seconds after their last change.
+
+	Walks the primary key in windows of `batch_size` notes, so no batch
+	reads or locks more than that many rows however large the table is.
+	The empty ones of each window go through bulk.delete_notes with their
+	params, grants, history and postings, one commit per batch. Sleeps
+	`pause` seconds between batches, longer when needed to stay under
+	`rate` deleted notes per second (0: no limit). `progress(report)` is
+	called after every batch. Returns the SweepReport.
+	"""
+	cutoff = datetime.utcnow() - timedelta(seconds=older_than)
+	report = SweepReport(dry_run)
+	report.max_id = db.session.query(db.func.max(Note.id)).scalar() or 0
+	while max_batches is None or report.batches < max_batches:
+		started = monotonic()
+		upper = window_end(report.last_id, batch_size)
+		if upper is None:
+			break
+		candidates = db.session.query(Note.id)\
+					.filter(Note.id > report.last_id, Note.id <= upper,
+							empty_note(), untouched_since(cutoff))
+		if not dry_run:
+			# an edit racing the sweep waits for this batch, or wins
+			candidates = candidates.with_for_update()
+		note_ids = [note_id for note_id, in candidates]
+		if note_ids and not dry_run:
+			try:
+				delete_notes(note_ids)
+				db.session.commit()
+			except:
+				db.session.rollback()
+				raise
+			report.deleted += len(note_ids)
+		else:
+			db.session.rollback()
+		report.found += len(note_ids)
+		report.batches += 1
+		report.last_id = upper
+		swept_notes.inc(len(note_ids), 'found' if dry_run else 'deleted')
+		sweep_batches.inc()
+		if progress is not None:
+			progress(report)
+
+		wait = pause
+		if rate and note_ids and not dry_run:
+			wait = max(wait, len(note_ids) / rate - (monotonic() - started))
+		if wait > 0:
+			sleep(wait)
+	_last_sweep['last'] = datetime.utcnow().timestamp()
+	return report
+
+
+class SweepScheduler:
+	"""Runs `sweep_empty_notes` every SWEEP_INTERVAL seconds in this process.
+
+	Off while SWEEP_INTERVAL is 0. Every process serving the app would run
+	its own, so enable it on one of them, or use `manage.py
+	sweep_empty_notes` from cron instead.
+	"""
+	def __init__(self, app=None):
+		self.app = None
+		self._thread = None
+		self._stop = threading.Event()
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		self.app = app
+
+	def start(self):
+		if not self.app.config['SWEEP_INTERVAL'] or self._thread is not None:
+			return
+		self._thread = threading.Thread(target=self.run, name='note-sweeper',
+										daemon=True)
+		self._thread.start()
+
+	def stop(self):
+		self._stop.set()
+
+	def run(self):
+		config = self.app.config
+		while not self._stop.wait(config['SWEEP_INTERVAL']):
+			with self.app.app_context():
+				try:
+					report = sweep_empty_notes(config['SWEEP_EMPTY_AFTER'],
+								config['SWEEP_BATCH_SIZE'], config['SWEEP_PAUSE'],
+								config['SWEEP_RATE'])
+					self.app.logger.info('note sweep: %s', report.as_dict())
+				except Exception:
+					self.app.logger.exception('note sweep failed')
+				finally:
+					db.session.remove()
+
+
+sweep_scheduler = SweepScheduler(app)
+
+
+@app.before_first_request
+def start_sweep_scheduler():
+	sweep_scheduler.start()
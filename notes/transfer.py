@@ -0,0 +1,200 @@
+"""Export of a user's notes as NDJSON (optionally zipped) and its import.
+
+One JSON object per line:
+
+	{"title": ..., "text": ..., "created": ..., "updated": ...,
+	 "private": ..., "change_possibility": ..., "encryption": ...}
+
+Both directions work a batch at a time, so memory does not grow with
+the number of notes.
+"""
+import json
+import zipfile
+from datetime import datetime
+from flask import _app_ctx_stack
+from notes import db
+from .models import Note, UserNoteParams
+from .compression import unpack_text
+from .queries import filter_user_notes
+from . import bulk
+
+
+TIME_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S')
+ARCHIVE_MEMBER = 'notes.ndjson'
+
+
+class ImportFormatError(ValueError):
+	def __init__(self, line, message):
+		super().__init__('line {}: {}'.format(line, message))
+		self.line = line
+		self.imported = 0
+
+
+def export_query(user_id, include_private=False, viewer_id=None):
+	"""The notes user_notes() lists for the same viewer, oldest first."""
+	query = db.session.query(Note.title, Note._text, Note.text_z,
+						Note.created, Note.updated,
+						UserNoteParams.private_access,
+						UserNoteParams.change_possibility,
+						UserNoteParams.encryption)
+	return filter_user_notes(query, user_id, include_private, viewer_id)\
+				.order_by(Note.id)
+
+
+def export_records(user_id, include_private=False, viewer_id=None,
+				batch_size=500):
+	"""Export records read through a server-side cursor.
+
+	`include_private` is for the owner; anyone else gets no text for
+	encrypted notes, as on note_view.
+	"""
+	rows = export_query(user_id, include_private, viewer_id)\
+				.yield_per(batch_size)
+	for row in rows:
+		record = {
+			'title': row.title,
+			'created': row.created.isoformat() if row.created else None,
+			'updated': row.updated.isoformat() if row.updated else None,
+			'private': bool(row.private_access),
+			'change_possibility': bool(row.change_possibility),
+			'encryption': bool(row.encryption),
+		}
+		if include_private or not row.encryption:
+			record['text'] = unpack_text(row._text, row.text_z)
+		yield record
+
+
+def ndjson_chunks(records):
+	for record in records:
+		yield (json.dumps(record, ensure_ascii=False) + '\n').encode('utf-8')
+
+
+class _ZipSink:
+	"""Write-only file for ZipFile; `drain()` hands over what was written."""
+	def __init__(self):
+		self._chunks = []
+
+	def write(self, data):
+		self._chunks.append(bytes(data))
+		return len(data)
+
+	def flush(self):
+		pass
+
+	def drain(self):
+		data = b''.join(self._chunks)
+		self._chunks = []
+		return data
+
+
+def zip_chunks(records):
+	"""A zip archive holding the NDJSON export, produced as it is written."""
+	sink = _ZipSink()
+	# the sink cannot seek, so ZipFile streams with data descriptors
+	with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+		with archive.open(ARCHIVE_MEMBER, 'w', force_zip64=True) as member:
+			for line in ndjson_chunks(records):
+				member.write(line)
+				data = sink.drain()
+				if data:
+					yield data
+	yield sink.drain()
+
+
+def parse_time(value, line):
+	if value is None:
+		return None
+	for time_format in TIME_FORMATS:
+		try:
+			return datetime.strptime(value, time_format)
+		except (TypeError, ValueError):
+			pass
+	raise ImportFormatError(line, 'bad timestamp {!r}'.format(value))
+
+
+def parse_record(raw, line):
+	try:
+		record = json.loads(raw.decode('utf-8'))
+	except ValueError:
+		raise ImportFormatError(line, 'not a JSON object')
+	if not isinstance(record, dict):
+		raise ImportFormatError(line, 'not a JSON object')
+	title, text = record.get('title'), record.get('text')
+	if not isinstance(title, str) or not title.strip() or len(title) > 100:
+		raise ImportFormatError(line, 'title must be 1 to 100 characters')
+	if text is not None and not isinstance(text, str):
+		raise ImportFormatError(line, 'text must be a string')
+	return {
+		'title': title,
+		'text': text,
+		'created': parse_time(record.get('created'), line),
+		'updated': parse_time(record.get('updated'), line),
+		'private': bool(record.get('private', True)),
+		'change_possibility': bool(record.get('change_possibility', False)),
+		'encryption': bool(record.get('encryption', False)),
+	}
+
+
+def parse_lines(lines):
+	for line, raw in enumerate(lines, 1):
+		if raw.strip():
+			yield parse_record(raw, line)
+
+
+def read_records(stream):
+	"""Records of an NDJSON or zipped export read from a binary file."""
+	head = stream.read(4)
+	stream.seek(0)
+	if head != b'PK\x03\x04':
+		yield from parse_lines(stream)
+		return
+	try:
+		archive = zipfile.ZipFile(stream)
+	except zipfile.BadZipFile:
+		raise ImportFormatError(0, 'not a zip archive')
+	with archive:
+		for name in archive.namelist():
+			if name.endswith('.ndjson'):
+				with archive.open(name) as member:
+					yield from parse_lines(member)
+
+
+def forget_recorded_queries():
+	# with DEBUG on, Flask-SQLAlchemy keeps every statement and its
+	# parameters until the app context ends
+	context = _app_ctx_stack.top
+	queries = getattr(context, 'sqlalchemy_queries', None)
+	if queries:
+		del queries[:]
+
+
+def import_notes(user_id, records, chunk_size=500):
+	"""Insert `records` as new notes of `user_id`, committing per chunk.
+
+	Every note gets a fresh url_id. A malformed record stops the import
+	with ImportFormatError; chunks before it stay committed and the error
+	carries how many notes they held.
+	"""
+	imported = 0
+	chunk = []
+
+	def flush():
+		bulk.insert_notes(chunk, user_id)
+		db.session.commit()
+		forget_recorded_queries()
+		del chunk[:]
+
+	try:
+		for record in records:
+			chunk.append(record)
+			if len(chunk) >= chunk_size:
+				imported += len(chunk)
+				flush()
+		if chunk:
+			imported += len(chunk)
+			flush()
+	except ImportFormatError as error:
+		db.session.rollback()
+		error.imported = imported
+		raise
+	return imported
@@ -0,0 +1,44 @@
+from sqlalchemy import and_
+from sqlalchemy.exc import IntegrityError
+from notes import db
+
+
+def increment(table, key, deltas):
+	"""Add `deltas` to the counters of the `table` row with primary key `key`.
+
+	`key` and `deltas` map column names to values. A missing row is
+	created with the deltas clamped at 0, counters never go negative.
+	PostgreSQL and MySQL do it in one upsert statement. Elsewhere it is an
+	UPDATE, then the INSERT inside a savepoint, and the UPDATE again if a
+	concurrent transaction created the row first; the savepoint is taken
+	on the connection, so rolling it back leaves the session's
+	after_rollback hooks alone. Runs in the caller's transaction.
+	"""
+	row = dict(key)
+	row.update((name, max(delta, 0)) for name, delta in deltas.items())
+	values = {name: table.c[name] + delta for name, delta in deltas.items()}
+	connection = db.session.connection(clause=table.insert())
+	dialect = connection.dialect.name
+
+	if dialect == 'postgresql':
+		from sqlalchemy.dialects.postgresql import insert
+		connection.execute(insert(table).values(row)
+				.on_conflict_do_update(index_elements=list(key), set_=values))
+		return
+	if dialect == 'mysql':
+		from sqlalchemy.dialects.mysql import insert
+		connection.execute(insert(table).values(row)
+				.on_duplicate_key_update(values))
+		return
+
+	update = table.update()\
+				.where(and_(*(table.c[name] == value
+							for name, value in key.items())))\
+				.values(values)
+	if connection.execute(update).rowcount:
+		return
+	try:
+		with connection.begin_nested():
+			connection.execute(table.insert(), row)
+	except IntegrityError:
+		connection.execute(update)
@@ -0,0 +1,135 @@
+import threading
+from bisect import bisect_left, bisect_right
+from time import monotonic
+from sqlalchemy import event
+from notes import app, db
+from .models import User
+
+
+class UsernameIndex:
+	"""Every username, sorted case-insensitively, for prefix lookups.
+
+	Two parallel lists: the casefolded keys, searched with bisect, and the
+	usernames themselves (sharing the key string when it is already
+	lowercase). Changes made by this process are applied when their
+	transaction commits; the whole index is reloaded after `ttl` seconds
+	to pick up users registered or renamed through other processes.
+	"""
+	def __init__(self, app=None):
+		self.ttl = None
+		self._keys = []
+		self._names = []
+		self._loaded = None
+		self._lock = threading.Lock()
+		if app is not None:
+			self.init_app(app)
+
+	def init_app(self, app):
+		self.ttl = app.config['USERNAME_INDEX_TTL']
+		event.listen(db.session, 'after_commit', self._after_commit)
+		event.listen(db.session, 'after_rollback', self._after_rollback)
+
+	@staticmethod
+	def key(username):
+		key = username.lower()
+		return username if key == username else key
+
+	def load(self, usernames):
+		names = sorted(usernames, key=str.lower)
+		keys = [self.key(name) for name in names]
+		with self._lock:
+			self._keys, self._names = keys, names
+			self._loaded = monotonic()
+
+	def refresh(self):
+		"""Reload from the users table when missing or older than `ttl`."""
+		if self._loaded is not None and (self.ttl is None
+				or monotonic() - self._loaded < self.ttl):
+			return
+		self.load(username for username, in
+				db.session.query(User.username).yield_per(1000))
+
+	def add(self, username):
+		key = self.key(username)
+		with self._lock:
+			index = bisect_right(self._keys, key)
+			self._keys.insert(index, key)
+			self._names.insert(index, username)
+
+	def remove(self, username):
+		key = self.key(username)
+		with self._lock:
+			start = bisect_left(self._keys, key)
+			stop = bisect_right(self._keys, key, start)
+			for index in range(start, stop):
+				if self._names[index] == username:
+					del self._keys[index], self._names[index]
+					return
+
+	def prefix(self, prefix, limit=10, offset=0):
+		"""Up to `limit` usernames starting with `prefix`, in key order."""
+		self.refresh()
+		key = prefix.lower()
+		with self._lock:
+			start = bisect_left(self._keys, key) + offset
+			stop = min(start + limit, len(self._keys))
+			names = []
+			for index in range(start, stop):
+				if not self._keys[index].startswith(key):
+					break
+				names.append(self._names[index])
+			return names
+
+	def __contains__(self, username):
+		self.refresh()
+		key = self.key(username)
+		with self._lock:
+			start = bisect_left(self._keys, key)
+			stop = bisect_right(self._keys, key, start)
+			return username in self._names[start:stop]
+
+	def __len__(self):
+		return len(self._keys)
+
+	def memory_usage(self):
+		"""Bytes held by the two lists and the strings only they share."""
+		from sys import getsizeof
+		with self._lock:
+			strings = {id(value): value for value in self._keys + self._names}
+			return getsizeof(self._keys) + getsizeof(self._names) \
+				+ sum(getsizeof(value) for value in strings.values())
+
+	# changes are queued on the session and applied once it commits
+
+	def added(self, username):
+		self._schedule(None, username)
+
+	def renamed(self, old, new):
+		if old != new:
+			self._schedule(old, new)
+
+	def removed(self, username):
+		self._schedule(username, None)
+
+	def _schedule(self, old, new):
+		db.session.info.setdefault('username_changes', []).append((old, new))
+
+	def _after_commit(self, session):
+		for old, new in session.info.pop('username_changes', ()):
+			if self._loaded is None:
+				continue
+			if old is not None:
+				self.remove(old)
+			if new is not None:
+				self.add(new)
+
+	def _after_rollback(self, session):
+		session.info.pop('username_changes', None)
+
+
+username_index = UsernameIndex(app)
+
+
+@app.before_first_request
+def load_username_index():
+	username_index.refresh()